@@ -1,24 +1,35 @@
-import cv2
+import time
+BOOT_STARTED = time.perf_counter()
+
 from datetime import datetime, timedelta
-import openpyxl
-import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import sqlite3
 import os
+import sys
 import logging
-import io
+import tempfile
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import json
-from apscheduler.schedulers.background import BackgroundScheduler
+import hashlib
+import uuid
+import threading
+import queue
+import socket
+import subprocess
+import atexit
+import weakref
+from contextlib import contextmanager
+from types import MappingProxyType
+from concurrent import futures
 from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, flash, Response, make_response
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from zipfile import BadZipFile
-import qrcode
+from db import get_db, release_db, DATABASE_PATH
 from io import BytesIO
-import base64
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -36,13 +47,75 @@ FEEDBACK_EXCEL_PATH = "static/feedback.xlsx"
 GOOGLE_SHEET_NAME = "Attendance_Tracker"
 CREDENTIALS_PATH = "credentials.json"
 CONFIG_PATH = "config.json"
+MATRIX_DIR = "attendance_matrix"
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
 
 # Email configuration for Idea #3 (replace with your email settings)
 EMAIL_ADDRESS = "your-email@gmail.com"
 EMAIL_PASSWORD = "your-app-password"
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
+# Set SMTP_STARTTLS=0 only for a local stand-in such as aiosmtpd (python -m aiosmtpd -n -l localhost:8025)
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT = 30
+SMTP_MESSAGES_PER_CONNECTION = 100  # reconnect after this many messages on one connection
+
+# Queued email is sent by MAIL_WORKERS threads, at most MAIL_RATE_LIMIT messages per second in
+# total; failures are retried after MAIL_RETRY_BASE seconds, doubling up to MAIL_RETRY_MAX, and
+# given up after MAIL_MAX_ATTEMPTS tries
+MAIL_WORKERS = 4
+MAIL_RATE_LIMIT = 5
+MAIL_POLL_INTERVAL = 30
+MAIL_RETRY_BASE = 60
+MAIL_RETRY_MAX = 6 * 3600
+MAIL_MAX_ATTEMPTS = 8
+MAIL_SEND_LEASE = 900  # seconds a claimed message stays hidden from other workers
+
+# Scheduled jobs run in one process only: the holder of the scheduler lease, which every process
+# tries to take or renew each SCHEDULER_POLL_INTERVAL seconds and which lapses after SCHEDULER_LEASE_TTL
+SCHEDULER_POLL_INTERVAL = 30
+SCHEDULER_LEASE_TTL = 90
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") == "1"
+
+# Bulk uploads are stored in UPLOAD_DIR and imported by UPLOAD_WORKERS background threads,
+# UPLOAD_CHUNK_ROWS rows per transaction; a job whose worker stops renewing its claim for
+# UPLOAD_JOB_LEASE seconds is picked up again after its last committed chunk
+UPLOAD_DIR = "uploads"
+UPLOAD_WORKERS = 2
+UPLOAD_CHUNK_ROWS = 1000
+UPLOAD_POLL_INTERVAL = 30
+UPLOAD_JOB_LEASE = 300
+
+# 'flask boot-report' and tests/test_boot_time.py fail if importing app.py in a fresh interpreter
+# takes longer than this
+BOOT_BUDGET_MS = int(os.environ.get("BOOT_BUDGET_MS", 2000))
+
+# Attendance changes are written to ATTENDANCE_SHEET_PATH in the background by the scheduler leader
+# only, at most every EXCEL_FLUSH_INTERVAL seconds or sooner once EXCEL_FLUSH_BATCH changes are
+# waiting; it counts the unexported rows every EXCEL_FLUSH_CHECK_INTERVAL seconds
+EXCEL_FLUSH_INTERVAL = 30
+EXCEL_FLUSH_BATCH = 100
+EXCEL_FLUSH_CHECK_INTERVAL = 2
+
+# activity_log rows are queued and written in batches off the request path; set ACTIVITY_LOG_SYNC=1
+# to write each one immediately (e.g. when testing)
+ACTIVITY_LOG_FLUSH_INTERVAL = 0.25
+ACTIVITY_LOG_BATCH = 200
+ACTIVITY_LOG_SYNC = os.environ.get("ACTIVITY_LOG_SYNC") == "1"
+
+# Attendance changes reach Google Sheets through the gsheets_outbox table, drained by a background
+# worker every GSHEETS_SYNC_INTERVAL seconds (or right after a change); failed pushes are retried
+# after GSHEETS_RETRY_BASE seconds, doubling up to GSHEETS_RETRY_MAX, and marked failed after
+# GSHEETS_MAX_ATTEMPTS tries. Nothing is queued while CREDENTIALS_PATH is missing.
+GSHEETS_SYNC_INTERVAL = 5
+GSHEETS_RETRY_BASE = 30
+GSHEETS_RETRY_MAX = 3600
+GSHEETS_MAX_ATTEMPTS = 10
+GSHEETS_SYNC_LEASE = 300  # seconds a claimed batch stays hidden from other workers
+GSHEETS_MAX_PAYLOAD = 2 * 1024 * 1024  # bytes of JSON per values_batch_update before it is split
+GSHEETS_WORKSHEET_TTL = 60  # seconds the spreadsheet's tab list is trusted before being listed again
+
+SCAN_BATCH_RETENTION = 24 * 3600  # seconds a (session, seq) is remembered to drop replayed scan batches
 
 # Load or initialize configuration for Idea #3
 def load_config():
@@ -67,7 +140,7 @@ class User(UserMixin):
         self.role = role
 
 def init_db():
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS users (
                  username TEXT PRIMARY KEY,
@@ -91,6 +164,199 @@ def init_db():
                  pin TEXT,
                  comment TEXT,
                  date TEXT)''')
+    # Attendance is stored here; Attendence_data.xlsx is only an export of this table
+    c.execute('''CREATE TABLE IF NOT EXISTS attendance (
+                 pin TEXT NOT NULL,
+                 date TEXT NOT NULL,
+                 status TEXT NOT NULL,
+                 source TEXT,
+                 updated_at TEXT,
+                 exported INTEGER DEFAULT 0,
+                 PRIMARY KEY (pin, date))''')
+    c.execute('PRAGMA table_info(attendance)')
+    if 'exported' not in [column[1] for column in c.fetchall()]:
+        c.execute('ALTER TABLE attendance ADD COLUMN exported INTEGER DEFAULT 0')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_unexported ON attendance (exported) WHERE exported = 0")
+    # Daily present/absent counts per course and branch, kept current by triggers on attendance
+    c.execute('''CREATE TABLE IF NOT EXISTS attendance_daily (
+                 date TEXT NOT NULL,
+                 course TEXT NOT NULL,
+                 branch TEXT NOT NULL,
+                 present INTEGER NOT NULL DEFAULT 0,
+                 absent INTEGER NOT NULL DEFAULT 0,
+                 total INTEGER NOT NULL DEFAULT 0,
+                 PRIMARY KEY (date, course, branch))''')
+    # Roster changes update and add or drop a course and branch across all dates
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_daily_group ON attendance_daily (course, branch)")
+    # attendance_daily holds one row for every date with attendance and every course and branch that
+    # has students (see rebuild_attendance_daily), so the triggers add and drop whole dates and groups.
+    # Triggers from before that rule are replaced and the rollup rebuilt.
+    rollup_triggers = ["attendance_daily_insert", "attendance_daily_update", "attendance_daily_delete",
+                       "attendance_daily_student_insert", "attendance_daily_student_delete", "attendance_daily_student_move"]
+    c.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'attendance_daily_student_delete'")
+    existing = c.fetchone()
+    rollup_triggers_stale = existing is None or "total = 0" not in existing[0]
+    if rollup_triggers_stale:
+        for name in rollup_triggers:
+            c.execute(f"DROP TRIGGER IF EXISTS {name}")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS attendance_daily_insert AFTER INSERT ON attendance
+                 BEGIN
+                     INSERT INTO attendance_daily (date, course, branch, present, absent, total)
+                         SELECT NEW.date, course, branch, 0, COUNT(*), COUNT(*) FROM students
+                         WHERE course IS NOT NULL AND branch IS NOT NULL
+                           AND NOT EXISTS (SELECT 1 FROM attendance_daily WHERE date = NEW.date)
+                         GROUP BY course, branch;
+                     UPDATE attendance_daily SET present = present + (NEW.status = 'Present'),
+                                                 absent = total - present - (NEW.status = 'Present')
+                         WHERE date = NEW.date AND (course, branch) = (SELECT course, branch FROM students WHERE pin = NEW.pin);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS attendance_daily_update AFTER UPDATE OF status ON attendance
+                 WHEN OLD.status IS NOT NEW.status
+                 BEGIN
+                     UPDATE attendance_daily SET present = present + (NEW.status = 'Present') - (OLD.status = 'Present'),
+                                                 absent = total - present - (NEW.status = 'Present') + (OLD.status = 'Present')
+                         WHERE date = NEW.date AND (course, branch) = (SELECT course, branch FROM students WHERE pin = NEW.pin);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS attendance_daily_delete AFTER DELETE ON attendance
+                 BEGIN
+                     UPDATE attendance_daily SET present = present - (OLD.status = 'Present'),
+                                                 absent = total - present + (OLD.status = 'Present')
+                         WHERE date = OLD.date AND (course, branch) = (SELECT course, branch FROM students WHERE pin = OLD.pin);
+                     DELETE FROM attendance_daily WHERE date = OLD.date AND NOT EXISTS (SELECT 1 FROM attendance WHERE date = OLD.date);
+                 END''')
+    # total counts the students in each course and branch, so roster changes move it too. A student's
+    # own Present mark for the row's date is the subquery on attendance (a primary key lookup).
+    leave_rollup = '''UPDATE attendance_daily
+                         SET total = total - 1,
+                             present = present - (SELECT COUNT(*) FROM attendance a WHERE a.pin = OLD.pin AND a.date = attendance_daily.date AND a.status = 'Present'),
+                             absent = total - 1 - present + (SELECT COUNT(*) FROM attendance a WHERE a.pin = OLD.pin AND a.date = attendance_daily.date AND a.status = 'Present')
+                         WHERE course = OLD.course AND branch = OLD.branch;
+                     DELETE FROM attendance_daily WHERE course = OLD.course AND branch = OLD.branch AND total = 0;'''
+    # A group without rows is one this student is the first to join; it gets a row for every date.
+    # new_group is the outer loop so the dates are only read for such a group.
+    # Attendance rows can outlive their student, so a (re)joining student may bring Present marks along.
+    join_rollup = '''UPDATE attendance_daily
+                         SET total = total + 1,
+                             present = present + (SELECT COUNT(*) FROM attendance a WHERE a.pin = NEW.pin AND a.date = attendance_daily.date AND a.status = 'Present'),
+                             absent = total + 1 - present - (SELECT COUNT(*) FROM attendance a WHERE a.pin = NEW.pin AND a.date = attendance_daily.date AND a.status = 'Present')
+                         WHERE course = NEW.course AND branch = NEW.branch;
+                     INSERT INTO attendance_daily (date, course, branch, present, absent, total)
+                         SELECT date, NEW.course, NEW.branch, present, 1 - present, 1
+                         FROM (SELECT d.date, (SELECT COUNT(*) FROM attendance a WHERE a.pin = NEW.pin AND a.date = d.date AND a.status = 'Present') AS present
+                               FROM (SELECT 1 WHERE NEW.course IS NOT NULL AND NEW.branch IS NOT NULL
+                                       AND NOT EXISTS (SELECT 1 FROM attendance_daily WHERE course = NEW.course AND branch = NEW.branch)) new_group
+                               CROSS JOIN (SELECT DISTINCT date FROM attendance) d);'''
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS attendance_daily_student_insert AFTER INSERT ON students
+                 BEGIN
+                     {join_rollup}
+                 END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS attendance_daily_student_delete AFTER DELETE ON students
+                 BEGIN
+                     {leave_rollup}
+                 END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS attendance_daily_student_move AFTER UPDATE OF course, branch ON students
+                 WHEN OLD.course IS NOT NEW.course OR OLD.branch IS NOT NEW.branch
+                 BEGIN
+                     {leave_rollup}
+                     {join_rollup}
+                 END''')
+    c.execute('''CREATE TABLE IF NOT EXISTS export_state (
+                 target TEXT PRIMARY KEY,
+                 last_flushed_at TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS gsheets_outbox (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 course TEXT NOT NULL,
+                 pin TEXT NOT NULL,
+                 date TEXT NOT NULL,
+                 status TEXT NOT NULL,
+                 queued_at TEXT NOT NULL,
+                 attempts INTEGER NOT NULL DEFAULT 0,
+                 next_attempt_at TEXT NOT NULL,
+                 last_error TEXT,
+                 failed INTEGER NOT NULL DEFAULT 0)''')
+    c.execute('PRAGMA table_info(gsheets_outbox)')
+    if 'failed' not in [column[1] for column in c.fetchall()]:
+        c.execute('ALTER TABLE gsheets_outbox ADD COLUMN failed INTEGER NOT NULL DEFAULT 0')
+    c.execute("DROP INDEX IF EXISTS idx_gsheets_outbox_due")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_gsheets_outbox_pending ON gsheets_outbox (next_attempt_at) WHERE failed = 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_gsheets_outbox_failed ON gsheets_outbox (queued_at) WHERE failed = 1")
+    c.execute("DELETE FROM gsheets_outbox WHERE failed = 1 AND queued_at < ?", ((datetime.now() - timedelta(days=90)).strftime("%Y-%m-%d %H:%M:%S"),))
+    if not gsheets_configured():
+        # Changes queued before the credentials went away can never be pushed
+        c.execute("UPDATE gsheets_outbox SET failed = 1, last_error = ? WHERE failed = 0", (f"{CREDENTIALS_PATH} not found",))
+        if c.rowcount:
+            logging.warning(f"Marked {c.rowcount} queued Google Sheets changes failed: {CREDENTIALS_PATH} not found")
+    c.execute('''CREATE TABLE IF NOT EXISTS mail_outbox (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 to_email TEXT NOT NULL,
+                 subject TEXT,
+                 body TEXT,
+                 status TEXT NOT NULL DEFAULT 'pending',
+                 queued_at TEXT NOT NULL,
+                 attempts INTEGER NOT NULL DEFAULT 0,
+                 next_attempt_at TEXT NOT NULL,
+                 last_error TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mail_outbox_due ON mail_outbox (status, next_attempt_at)")
+    c.execute('''CREATE TABLE IF NOT EXISTS scheduler_lease (
+                 id INTEGER PRIMARY KEY CHECK (id = 1),
+                 holder TEXT,
+                 expires_at TEXT)''')
+    c.execute("INSERT OR IGNORE INTO scheduler_lease (id, holder, expires_at) VALUES (1, NULL, '')")
+    c.execute('''CREATE TABLE IF NOT EXISTS job_runs (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 job TEXT NOT NULL,
+                 started_at TEXT NOT NULL,
+                 finished_at TEXT,
+                 duration_ms INTEGER,
+                 outcome TEXT,
+                 error TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_job_runs_job ON job_runs (job, started_at)")
+    c.execute("DELETE FROM job_runs WHERE started_at < ?", ((datetime.now() - timedelta(days=90)).strftime("%Y-%m-%d %H:%M:%S"),))
+    c.execute('''CREATE TABLE IF NOT EXISTS upload_jobs (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 filename TEXT NOT NULL,
+                 path TEXT NOT NULL,
+                 status TEXT NOT NULL DEFAULT 'queued',
+                 created_by TEXT,
+                 created_at TEXT NOT NULL,
+                 started_at TEXT,
+                 finished_at TEXT,
+                 lease_expires_at TEXT NOT NULL DEFAULT '',
+                 lease_owner TEXT,
+                 total_rows INTEGER,
+                 processed_rows INTEGER NOT NULL DEFAULT 0,
+                 imported_rows INTEGER NOT NULL DEFAULT 0,
+                 skipped_rows INTEGER NOT NULL DEFAULT 0,
+                 error_rows INTEGER NOT NULL DEFAULT 0,
+                 added_rows INTEGER,
+                 error TEXT)''')
+    c.execute('PRAGMA table_info(upload_jobs)')
+    if 'lease_owner' not in [column[1] for column in c.fetchall()]:
+        c.execute('ALTER TABLE upload_jobs ADD COLUMN lease_owner TEXT')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_upload_jobs_status ON upload_jobs (status, lease_expires_at)")
+    # One row per uploaded row that was skipped or failed to save, for the job's error report
+    c.execute('''CREATE TABLE IF NOT EXISTS upload_job_errors (
+                 job_id INTEGER NOT NULL,
+                 row INTEGER NOT NULL,
+                 pin TEXT,
+                 name TEXT,
+                 branch TEXT,
+                 course TEXT,
+                 reason TEXT NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_upload_job_errors_job ON upload_job_errors (job_id, row)")
+    upload_cutoff = (datetime.now() - timedelta(days=90)).strftime("%Y-%m-%d %H:%M:%S")
+    c.execute("DELETE FROM upload_job_errors WHERE job_id IN (SELECT id FROM upload_jobs WHERE created_at < ?)", (upload_cutoff,))
+    c.execute("DELETE FROM upload_jobs WHERE created_at < ?", (upload_cutoff,))
+    c.execute('''CREATE TABLE IF NOT EXISTS absence_reminders (
+                 pin TEXT PRIMARY KEY,
+                 reminded_on TEXT NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date, status)")
+    c.execute('''CREATE TABLE IF NOT EXISTS scan_batches (
+                 session_id TEXT NOT NULL,
+                 seq INTEGER NOT NULL,
+                 received_at TEXT,
+                 PRIMARY KEY (session_id, seq))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_scan_batches_received ON scan_batches (received_at)")
     c.execute("INSERT OR IGNORE INTO users VALUES ('trainer1', 'pass456', 'trainer')")
     
 
@@ -104,70 +370,390 @@ def init_db():
     if 'resume_path' not in columns:
         c.execute('ALTER TABLE students ADD COLUMN resume_path TEXT')
         logging.info("Added 'resume_path' column to students table")
-    
+    create_indexes(c)
+    create_student_search(c)
+    # Bumped by every change to students so each worker knows when its cached roster is stale
+    c.execute('''CREATE TABLE IF NOT EXISTS roster_version (
+                 id INTEGER PRIMARY KEY CHECK (id = 1),
+                 version INTEGER NOT NULL)''')
+    c.execute("INSERT OR IGNORE INTO roster_version (id, version) VALUES (1, 0)")
+    # Only the columns the Roster holds (and photo_path) count; email and resume uploads do not
+    roster_events = {"insert": "INSERT", "update": "UPDATE OF pin, name, branch, course, photo_path", "delete": "DELETE"}
+    c.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'roster_version_update'")
+    existing = c.fetchone()
+    if existing and roster_events["update"] not in existing[0]:
+        c.execute("DROP TRIGGER roster_version_update")
+    for name, event in roster_events.items():
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS roster_version_{name} AFTER {event} ON students BEGIN
+                         UPDATE roster_version SET version = version + 1 WHERE id = 1;
+                     END''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS file_imports (
+                 path TEXT PRIMARY KEY,
+                 stamp TEXT NOT NULL,
+                 imported_at TEXT)''')
     try:
-        if os.path.exists(EXCEL_PATH):
-            excel_data = pd.ExcelFile(EXCEL_PATH)
-            total_students_processed = 0
-            for sheet_name in excel_data.sheet_names:
-                df = excel_data.parse(sheet_name)
+        # Every worker runs init_db at boot; only parse the roster workbook when it has changed
+        excel_stamp = str(get_file_stamp(EXCEL_PATH)) if os.path.exists(EXCEL_PATH) else None
+        c.execute("SELECT stamp FROM file_imports WHERE path = ?", (EXCEL_PATH,))
+        imported = c.fetchone()
+        if excel_stamp and imported and imported[0] == excel_stamp:
+            logging.info(f"{EXCEL_PATH} unchanged since its last import. Skipping student import.")
+        elif excel_stamp:
+            import pandas as pd
+            roster_workbook = workbook_snapshot(EXCEL_PATH)
+            for sheet_name in roster_workbook.sheetnames:
+                rows = roster_workbook.rows(sheet_name)
+                df = pd.DataFrame(list(rows[1:]), columns=list(rows[0]) if rows else None).dropna(how="all")
                 required_columns = ["PIN (Roll.No)", "NAME", "BRANCH"]
                 if not all(col in df.columns for col in required_columns):
                     logging.warning(f"Sheet '{sheet_name}' missing required columns: {required_columns}. Skipping.")
                     continue
-                sheet_students = 0
-                sheet_skipped = 0
-                for index, row in df.iterrows():
-                    pin = str(row["PIN (Roll.No)"]).strip('"') if pd.notna(row["PIN (Roll.No)"]) else None
-                    name = str(row["NAME"]) if pd.notna(row["NAME"]) else None
-                    branch = str(row["BRANCH"]) if pd.notna(row["BRANCH"]) else None
-                    course = sheet_name
-                    if not pin or not name or not branch:
-                        logging.warning(f"Skipping row {index + 2} in sheet '{sheet_name}' due to missing data: PIN={pin}, Name={name}, Branch={branch}")
-                        sheet_skipped += 1
-                        continue
-                    insert_values = [pin, name, branch, course, f"static/images/{pin}.jpg", None, None]
-                    c.execute(f"INSERT OR IGNORE INTO students (pin, name, branch, course, photo_path, email, resume_path) VALUES (?, ?, ?, ?, ?, ?, ?)", insert_values)
-                    c.execute("INSERT OR IGNORE INTO users VALUES (?, ?, 'student')", (pin, "LOKESH"))
-                    sheet_students += 1
-                    logging.info(f"Added student {name} (PIN: {pin}) from sheet '{sheet_name}'")
-                total_students_processed += sheet_students
-                logging.info(f"Processed sheet '{sheet_name}': {sheet_students} students added, {sheet_skipped} rows skipped.")
+                students, rejected = clean_roster(df, course=sheet_name)
+                log_rejected_rows(rejected, f"sheet '{sheet_name}'")
+                save_students(c, students, photo_dir="static/images")
+                logging.info(f"Processed sheet '{sheet_name}': {len(students)} students imported, {len(rejected)} rows skipped.")
             c.execute("SELECT COUNT(*) FROM students")
             final_count = c.fetchone()[0]
             logging.info(f"Total students in database after initialization: {final_count}")
+            c.execute("INSERT OR REPLACE INTO file_imports (path, stamp, imported_at) VALUES (?, ?, ?)",
+                      (EXCEL_PATH, excel_stamp, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
         else:
             logging.warning(f"{EXCEL_PATH} not found during initialization. Skipping student import.")
     except Exception as e:
         logging.error(f"{EXCEL_PATH} not found or corrupted during init: {e}. Skipping student import.")
+
+    c.execute("SELECT COUNT(*) FROM attendance")
+    if c.fetchone()[0] == 0:
+        import_attendance_from_excel(c)
+    c.execute("SELECT EXISTS (SELECT 1 FROM attendance_daily), EXISTS (SELECT 1 FROM attendance)")
+    has_rollup, has_attendance = c.fetchone()
+    # A rollup kept by older triggers may hold stale totals or a different set of groups
+    if has_attendance and (not has_rollup or rollup_triggers_stale):
+        rebuild_attendance_daily(c)
+    conn.commit()
+
+ROSTER_COLUMNS = {"PIN (Roll.No)": "pin", "NAME": "name", "BRANCH": "branch", "COURSE": "course"}
+
+def clean_roster(df, course=None):
+    """Validate a roster sheet with vectorized pandas ops.
+
+    Returns (students, rejected). students has string pin/name/branch/course columns plus the
+    spreadsheet row each came from; rejected has the same columns and a reason per left-out row.
+    course, if given, overrides the COURSE column (init_db uses the sheet name).
+    """
+    import numpy as np
+    import pandas as pd
+    # Row numbers as the trainer sees them: the header is row 1 and df keeps its index when sliced
+    frame = pd.DataFrame({"row": df.index + 2}, index=df.index)
+    for column, field in ROSTER_COLUMNS.items():
+        if column in df.columns:
+            values = df[column]
+            frame[field] = values.astype(str).where(values.notna())
+        else:
+            frame[field] = None
+    frame["pin"] = frame["pin"].str.strip('"')
+    frame["course"] = course if course is not None else frame["course"].fillna("Default")
+
+    missing = {field: frame[field].isna() | (frame[field] == "") for field in ROSTER_COLUMNS.values()}
+    reason = np.select([missing["pin"], missing["name"], missing["branch"], missing["course"]],
+                       ["Missing PIN", "Missing NAME", "Missing BRANCH", "Missing COURSE"], default="")
+    valid = reason == ""
+    return frame[valid].reset_index(drop=True), frame[~valid].assign(reason=reason[~valid]).reset_index(drop=True)
+
+def save_students(c, students, update_existing=False, photo_dir=None):
+    """Write cleaned students and their student logins with executemany on cursor c.
+
+    Existing PINs are left alone unless update_existing, which refreshes name, branch and course but
+    keeps photo, email and resume. New students get photo_dir/<pin>.jpg as photo_path if photo_dir is set.
+    """
+    rows = [(pin, name, branch, course, f"{photo_dir}/{pin}.jpg" if photo_dir else None)
+            for pin, name, branch, course in students[["pin", "name", "branch", "course"]].itertuples(index=False, name=None)]
+    on_conflict = "DO UPDATE SET name = excluded.name, branch = excluded.branch, course = excluded.course" if update_existing else "DO NOTHING"
+    c.executemany(f'''INSERT INTO students (pin, name, branch, course, photo_path) VALUES (?, ?, ?, ?, ?)
+                      ON CONFLICT (pin) {on_conflict}''', rows)
+    c.executemany("INSERT OR IGNORE INTO users VALUES (?, ?, 'student')", [(row[0], "LOKESH") for row in rows])
+    return len(rows)
+
+def add_students_to_workbook(wb, students):
+    """Append a row to each course's sheet for every student not already on it; returns how many were added."""
+    added = 0
+    for course, group in students.groupby("course", sort=False):
+        index = get_sheet_index(wb, course)
+        for pin, name, branch in group[["pin", "name", "branch"]].itertuples(index=False, name=None):
+            if pin not in index.pin_rows:
+                index.add_student(pin, name, branch)
+                added += 1
+    return added
+
+def log_rejected_rows(rejected, source):
+    if len(rejected):
+        sample = ", ".join(f"row {row} ({reason})" for row, reason in rejected[["row", "reason"]].head(5).itertuples(index=False, name=None))
+        logging.warning(f"Skipped {len(rejected)} rows in {source}: {sample}{', ...' if len(rejected) > 5 else ''}")
+
+def rebuild_attendance_daily(c):
+    """Recompute attendance_daily from the attendance and students tables.
+
+    Every date with attendance gets a row for every course and branch that has students, so absent
+    also counts groups where nobody was marked.
+    """
+    c.execute("DELETE FROM attendance_daily")
+    c.execute('''INSERT INTO attendance_daily (date, course, branch, present, absent, total)
+                 SELECT d.date, r.course, r.branch, COALESCE(p.present, 0), r.total - COALESCE(p.present, 0), r.total
+                 FROM (SELECT DISTINCT date FROM attendance) d
+                 CROSS JOIN (SELECT course, branch, COUNT(*) AS total FROM students
+                             WHERE course IS NOT NULL AND branch IS NOT NULL GROUP BY course, branch) r
+                 LEFT JOIN (SELECT a.date, s.course, s.branch, COUNT(*) AS present FROM attendance a
+                            JOIN students s ON s.pin = a.pin WHERE a.status = 'Present'
+                            GROUP BY a.date, s.course, s.branch) p
+                     ON p.date = d.date AND p.course = r.course AND p.branch = r.branch''')
+    logging.info(f"Rebuilt attendance_daily with {c.rowcount} rows")
+
+@app.cli.command("rebuild-rollup")
+def rebuild_rollup_command():
+    """Backfill attendance_daily from the full attendance history."""
+    conn = get_db()
+    rebuild_attendance_daily(conn.cursor())
     conn.commit()
-    conn.close()
+
+def import_attendance_from_excel(c):
+    """One-time backfill of the attendance table from the legacy workbook."""
+    if not os.path.exists(ATTENDANCE_SHEET_PATH):
+        return
+    updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    records = []
+    try:
+        legacy_workbook = workbook_snapshot(ATTENDANCE_SHEET_PATH)
+        for sheet_name in legacy_workbook.sheetnames:
+            rows = legacy_workbook.rows(sheet_name)
+            if not rows:
+                continue
+            date_cols = []
+            for col, header in enumerate(rows[0][3:], 3):
+                try:
+                    date_cols.append((col, datetime.strptime(str(header), "%d-%m-%Y").strftime("%Y-%m-%d")))
+                except ValueError:
+                    continue
+            for row in rows[1:]:
+                if not row or not row[0]:
+                    continue
+                pin = str(row[0]).strip('"')
+                for col, iso_date in date_cols:
+                    status = row[col] if len(row) > col else None
+                    if status in ("Present", "Absent"):
+                        records.append((pin, iso_date, status, "import", updated_at, 1))
+    except Exception as e:
+        logging.error(f"Failed to read {ATTENDANCE_SHEET_PATH} for attendance import: {e}")
+        return
+    c.executemany("INSERT OR IGNORE INTO attendance (pin, date, status, source, updated_at, exported) VALUES (?, ?, ?, ?, ?, ?)", records)
+    logging.info(f"Imported {len(records)} attendance records from {ATTENDANCE_SHEET_PATH}")
+
+@app.teardown_request
+def release_request_db(exc):
+    release_db()
+
+# Queries the dashboard runs on most page views; check_query_plans() keeps them on their indexes
+FEEDBACK_LIST_QUERY = "SELECT pin, comment, date FROM feedback ORDER BY date DESC"
+RESUME_LIST_QUERY = "SELECT pin, name, branch, course, resume_path FROM students WHERE resume_path IS NOT NULL ORDER BY pin"
+RESUME_SEARCH_QUERY = "SELECT pin, name, branch, course, resume_path FROM students WHERE resume_path IS NOT NULL AND pin LIKE ? ORDER BY pin"
+
+INDEXES = {
+    "idx_students_course_branch": "CREATE INDEX IF NOT EXISTS idx_students_course_branch ON students (UPPER(course), UPPER(branch))",
+    "idx_students_branch": "CREATE INDEX IF NOT EXISTS idx_students_branch ON students (UPPER(branch))",
+    "idx_students_resume": "CREATE INDEX IF NOT EXISTS idx_students_resume ON students (pin) WHERE resume_path IS NOT NULL",
+    "idx_feedback_date": "CREATE INDEX IF NOT EXISTS idx_feedback_date ON feedback (date)",
+    "idx_feedback_pin": "CREATE INDEX IF NOT EXISTS idx_feedback_pin ON feedback (pin)",
+}
+
+def create_indexes(c):
+    for sql in INDEXES.values():
+        c.execute(sql)
+
+STUDENT_SEARCH_PAGE_SIZE = 60
+
+def create_student_search(c):
+    """Create the trigram FTS5 index over students and the triggers that keep it in sync."""
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'students_fts'")
+    exists = c.fetchone()
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5(
+                 pin, name, branch, course, content='students', content_rowid='rowid', tokenize='trigram')''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN
+                     INSERT INTO students_fts (rowid, pin, name, branch, course) VALUES (new.rowid, new.pin, new.name, new.branch, new.course);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+                     INSERT INTO students_fts (students_fts, rowid, pin, name, branch, course) VALUES ('delete', old.rowid, old.pin, old.name, old.branch, old.course);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF pin, name, branch, course ON students BEGIN
+                     INSERT INTO students_fts (students_fts, rowid, pin, name, branch, course) VALUES ('delete', old.rowid, old.pin, old.name, old.branch, old.course);
+                     INSERT INTO students_fts (rowid, pin, name, branch, course) VALUES (new.rowid, new.pin, new.name, new.branch, new.course);
+                 END''')
+    if not exists:
+        c.execute("INSERT INTO students_fts (students_fts) VALUES ('rebuild')")
+        logging.info("Built students_fts search index")
+
+def search_students(query, field, page=1):
+    """Return one page of (pin, name, branch, course, photo_path) matching query in field, best matches first."""
+    c = get_db().cursor()
+    limit = STUDENT_SEARCH_PAGE_SIZE + 1
+    offset = (page - 1) * STUDENT_SEARCH_PAGE_SIZE
+    if not query:
+        c.execute("SELECT pin, name, branch, course, photo_path FROM students ORDER BY pin LIMIT ? OFFSET ?", (limit, offset))
+    elif len(query) >= 3:
+        # Trigram tokens need at least three characters; the phrase is quoted so user input is not parsed as FTS syntax
+        phrase = '"' + query.replace('"', '""') + '"'
+        c.execute("""SELECT s.pin, s.name, s.branch, s.course, s.photo_path FROM students_fts
+                      JOIN students s ON s.rowid = students_fts.rowid
+                      WHERE students_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?""",
+                  (f"{field} : {phrase}", limit, offset))
+    else:
+        c.execute(f"SELECT pin, name, branch, course, photo_path FROM students WHERE {field} LIKE ? ORDER BY pin LIMIT ? OFFSET ?",
+                  (f'%{query}%', limit, offset))
+    students = c.fetchall()
+    return students[:STUDENT_SEARCH_PAGE_SIZE], len(students) > STUDENT_SEARCH_PAGE_SIZE
+
+def student_filter(branch=None, course=None, alias=None):
+    """Return a WHERE clause and params matching branch/course case-insensitively (uses the UPPER() indexes)."""
+    prefix = f"{alias}." if alias else ""
+    if branch and course:
+        return f" WHERE UPPER({prefix}course) = UPPER(?) AND UPPER({prefix}branch) = UPPER(?)", [course, branch]
+    elif branch:
+        return f" WHERE UPPER({prefix}branch) = UPPER(?)", [branch]
+    elif course:
+        return f" WHERE UPPER({prefix}course) = UPPER(?)", [course]
+    return "", []
+
+def hot_query_checks():
+    """Return (name, sql, params, index) for each hot query and the index it must be planned on."""
+    checks = []
+    for branch, course, index in [("CSE", "GENAI", "idx_students_course_branch"), (None, "GENAI", "idx_students_course_branch"),
+                                  ("CSE", None, "idx_students_branch")]:
+        where, params = student_filter(branch, course)
+        checks.append((f"student count (branch={branch}, course={course})", f"SELECT COUNT(*) FROM students{where}", params, index))
+        where, params = student_filter(branch, course, "s")
+        checks.append((f"attendance list (branch={branch}, course={course})",
+                       f"SELECT s.pin, a.status FROM students s LEFT JOIN attendance a ON a.pin = s.pin AND a.date = ?{where}",
+                       ["2025-01-01"] + params, index))
+    checks += [
+        ("feedback list", FEEDBACK_LIST_QUERY, [], "idx_feedback_date"),
+        ("resume list", RESUME_LIST_QUERY, [], "idx_students_resume"),
+        ("resume search", RESUME_SEARCH_QUERY, ["%22%"], "idx_students_resume"),
+        ("dashboard present count", "SELECT COALESCE(SUM(present), 0) FROM attendance_daily WHERE date = ?", ["2025-01-01"],
+         "sqlite_autoindex_attendance_daily_1"),
+    ]
+    return checks
+
+def explain_query_plan(sql, params):
+    c = get_db().cursor()
+    return " | ".join(row[3] for row in c.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall())
+
+def uses_index(plan, index):
+    return f"USING INDEX {index}" in plan or f"USING COVERING INDEX {index}" in plan
+
+def check_query_plans():
+    """Run EXPLAIN QUERY PLAN on the hot queries and return a list of those not using their index."""
+    failures = []
+    for name, sql, params, index in hot_query_checks():
+        plan = explain_query_plan(sql, params)
+        if not uses_index(plan, index):
+            failures.append(f"{name}: expected {index}, got plan: {plan}")
+    return failures
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Exit non-zero if any hot query stops using its index."""
+    failures = check_query_plans()
+    for failure in failures:
+        print(failure)
+    print(f"{len(failures)} query plan regression(s)")
+    sys.exit(1 if failures else 0)
 
 @login_manager.user_loader
 def load_user(username):
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT username, role FROM users WHERE username = ?", (username,))
     user_data = c.fetchone()
-    conn.close()
     if user_data:
         return User(user_data[0], user_data[1])
     return None
 
-try:
-    excel_data = pd.ExcelFile(EXCEL_PATH) if os.path.exists(EXCEL_PATH) else None
-except Exception as e:
-    logging.warning(f"Failed to load {EXCEL_PATH} at startup: {e}")
-    excel_data = None
+class GSheetsClient:
+    """Process-wide handle on GOOGLE_SHEET_NAME.
+
+    Authorizes once and again only when the access token has expired, and keeps a title -> worksheet
+    map for GSHEETS_WORKSHEET_TTL seconds. Call invalidate() when a cached worksheet turns out to be gone.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.creds = None
+        self.spreadsheet = None
+        self.worksheets = {}
+        self.worksheets_loaded_at = None
+
+    def get_spreadsheet(self):
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+        with self.lock:
+            if self.spreadsheet is None or getattr(self.creds, "access_token_expired", False):
+                if not os.path.exists(CREDENTIALS_PATH):
+                    logging.error(f"{CREDENTIALS_PATH} not found.")
+                    return None
+                self.creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_PATH, scope)
+                self.spreadsheet = gspread.authorize(self.creds).open(GOOGLE_SHEET_NAME)
+                # Cached worksheets are bound to the previous client
+                self.worksheets = {}
+                self.worksheets_loaded_at = None
+                logging.info(f"Authorized Google Sheets client for {GOOGLE_SHEET_NAME}")
+            return self.spreadsheet
+
+    def worksheet(self, title):
+        """Return the worksheet called title, or None if the spreadsheet has no such tab."""
+        with self.lock:
+            sheet = self.get_spreadsheet()
+            if sheet is None:
+                return None
+            if self.worksheets_loaded_at is None or time.monotonic() - self.worksheets_loaded_at > GSHEETS_WORKSHEET_TTL:
+                self.worksheets = {ws.title: ws for ws in sheet.worksheets()}
+                self.worksheets_loaded_at = time.monotonic()
+            return self.worksheets.get(title)
+
+    def add_worksheet(self, title, rows, cols):
+        """Create and return a tab called title, or None if Google Sheets is not configured."""
+        with self.lock:
+            sheet = self.get_spreadsheet()
+            if sheet is None:
+                return None
+            ws = sheet.add_worksheet(title=title, rows=rows, cols=cols)
+            self.worksheets[title] = ws
+            return ws
+
+    def invalidate(self, error=None):
+        """Forget the worksheet map; with an error, only if it says a worksheet no longer exists."""
+        if error is None or is_missing_worksheet_error(error):
+            with self.lock:
+                self.worksheets_loaded_at = None
+
+def is_missing_worksheet_error(error):
+    import gspread
+    # A deleted tab surfaces as WorksheetNotFound, or as a 400 when its A1 range no longer parses
+    return isinstance(error, gspread.exceptions.WorksheetNotFound) or \
+        (isinstance(error, gspread.exceptions.APIError) and "Unable to parse range" in str(error))
+
+def is_spreadsheet_wide_error(error):
+    """True for quota, server and connection errors, which no single tab is to blame for."""
+    import gspread
+    return isinstance(error, OSError) or \
+        (isinstance(error, gspread.exceptions.APIError) and (error.code == 429 or error.code >= 500))
+
+gsheets = GSheetsClient()
+
+def gsheets_configured():
+    return os.path.exists(CREDENTIALS_PATH)
 
 def initialize_gsheets():
-    if not os.path.exists(CREDENTIALS_PATH):
-        logging.error(f"{CREDENTIALS_PATH} not found.")
-        return None
     try:
-        creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_PATH, scope)
-        client = gspread.authorize(creds)
-        return client.open(GOOGLE_SHEET_NAME)
+        return gsheets.get_spreadsheet()
     except Exception as e:
         logging.error(f"Failed to initialize Google Sheets: {e}")
         return None
@@ -177,57 +763,306 @@ def sanitize_sheet_name(name, for_google_sheets=False):
         return name.replace('&', '').replace('/', '_').replace(':', '').replace('*', '').replace('?', '')
     return name
 
-def find_student_sheet_and_info(pin):
-    global excel_data
-    pin = str(pin).strip('"')
-    if excel_data:
+# Workbooks stay loaded between requests and are reloaded only when the file's mtime or size changes.
+# Writers share one openpyxl workbook per path under its lock; readers get an immutable snapshot.
+workbook_cache = {}
+workbook_snapshots = {}
+workbook_cache_stats = {"hits": 0, "misses": 0}
+workbook_cache_locks = {}
+workbook_cache_guard = threading.Lock()
+
+def get_file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def get_workbook_lock(path):
+    with workbook_cache_guard:
+        return workbook_cache_locks.setdefault(path, threading.Lock())
+
+def count_workbook_cache(hit):
+    with workbook_cache_guard:
+        workbook_cache_stats["hits" if hit else "misses"] += 1
+        return dict(workbook_cache_stats)
+
+def get_workbook_cache_stats():
+    with workbook_cache_guard:
+        return dict(workbook_cache_stats)
+
+class WorkbookSnapshot:
+    """Cell values of every sheet in a workbook, as tuples of row tuples; safe to share between threads."""
+
+    def __init__(self, stamp, sheets):
+        self.stamp = stamp
+        self.sheets = MappingProxyType(sheets)
+
+    @property
+    def sheetnames(self):
+        return tuple(self.sheets)
+
+    def rows(self, sheet_name):
+        return self.sheets[sheet_name]
+
+def workbook_snapshot(path):
+    """Return a read-only snapshot of the values in the workbook at path, or None if it does not exist.
+
+    The file is read in openpyxl's streaming read_only mode and only again once its mtime or size changes.
+    """
+    import openpyxl
+    if not os.path.exists(path):
+        return None
+    with get_workbook_lock(path):
+        stamp = get_file_stamp(path)
+        snapshot = workbook_snapshots.get(path)
+        if snapshot and snapshot.stamp == stamp:
+            count_workbook_cache(hit=True)
+            return snapshot
+        stats = count_workbook_cache(hit=False)
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
         try:
-            for sheet_name in excel_data.sheet_names:
-                df = excel_data.parse(sheet_name)
-                for _, row in df.iterrows():
-                    excel_pin = str(row["PIN (Roll.No)"]).strip('"')
-                    if excel_pin == pin:
-                        logging.info(f"Found PIN {pin} in sheet '{sheet_name}'")
-                        return sheet_name, row["NAME"], row["BRANCH"]
-        except Exception as e:
-            logging.error(f"Error parsing {EXCEL_PATH} in find_student_sheet_and_info: {e}")
-    
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-    c.execute("SELECT name, branch, course FROM students WHERE pin = ?", (pin,))
-    student_data = c.fetchone()
-    conn.close()
-    if student_data:
-        logging.info(f"Found PIN {pin} in database, course: {student_data[2]}")
-        return student_data[2], student_data[0], student_data[1]
-    
-    logging.warning(f"PIN {pin} not found in Excel or database.")
-    return "Unknown", f"Student_{pin}", "Unknown"
-
-def get_excel_date_column(ws, date):
-    for col in range(4, ws.max_column + 1):
-        if ws.cell(row=1, column=col).value == date:
-            return col
-    return None
+            snapshot = WorkbookSnapshot(stamp, {ws.title: tuple(ws.iter_rows(values_only=True)) for ws in wb.worksheets})
+        finally:
+            wb.close()
+        workbook_snapshots[path] = snapshot
+        logging.info(f"Loaded a snapshot of {path} (hits: {stats['hits']}, misses: {stats['misses']})")
+        return snapshot
+
+@contextmanager
+def cached_workbook(path):
+    """Yield the workbook at path (or a new empty one), holding its lock until the block exits.
+
+    Changes must be written with save_cached_workbook; if the block raises, the cached copy is dropped.
+    """
+    import openpyxl
+    with get_workbook_lock(path):
+        stamp = get_file_stamp(path) if os.path.exists(path) else None
+        cached = workbook_cache.get(path)
+        if stamp and cached and cached[0] == stamp:
+            count_workbook_cache(hit=True)
+            wb = cached[1]
+        else:
+            stats = count_workbook_cache(hit=False)
+            if stamp:
+                wb = openpyxl.load_workbook(path)
+            else:
+                # Start with no sheets; get_sheet_index adds one per course
+                wb = openpyxl.Workbook()
+                wb.remove(wb.active)
+            workbook_cache[path] = (stamp, wb)
+            logging.info(f"Loaded {path} into workbook cache (hits: {stats['hits']}, misses: {stats['misses']})")
+        try:
+            yield wb
+        except BaseException:
+            workbook_cache.pop(path, None)
+            raise
+
+def save_cached_workbook(path, wb):
+    if not wb.sheetnames:
+        # openpyxl cannot save a workbook without sheets; nothing was written to it either
+        return
+    workbook_snapshots.pop(path, None)
+    try:
+        wb.save(path)
+    except Exception:
+        workbook_cache.pop(path, None)
+        raise
+    workbook_cache[path] = (get_file_stamp(path), wb)
+
+class SheetIndex:
+    """PIN -> row and date -> column lookups for one attendance worksheet."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.pin_rows = {}
+        for row, (value,) in enumerate(ws.iter_rows(min_row=2, max_col=1, values_only=True), 2):
+            if value:
+                self.pin_rows[str(value).strip('"')] = row
+        self.date_cols = {}
+        for col, value in enumerate(next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ()), 1):
+            if col >= 4 and value:
+                self.date_cols.setdefault(value, col)
+
+    def date_column(self, date, create=False):
+        col = self.date_cols.get(date)
+        if col is None and create:
+            col = self.ws.max_column + 1 if self.ws.max_column >= 4 else 4
+            self.ws.cell(row=1, column=col).value = date
+            self.date_cols[date] = col
+            logging.info(f"Added new date column {date} at column {col} in sheet {self.ws.title}")
+        return col
+
+    def add_student(self, pin, name, branch):
+        """Append a row for pin unless it is already in the sheet; returns the row number."""
+        row = self.pin_rows.get(pin)
+        if row is None:
+            row = self.ws.max_row + 1
+            self.ws[f"A{row}"] = pin
+            self.ws[f"B{row}"] = name
+            self.ws[f"C{row}"] = branch
+            self.pin_rows[pin] = row
+        return row
+
+# Indexes live as long as the workbook object they were built from
+sheet_indexes = weakref.WeakKeyDictionary()
+
+def get_sheet_index(wb, sheet_name):
+    """Return the index for sheet_name in wb, creating the sheet with the standard headers if needed."""
+    indexes = sheet_indexes.setdefault(wb, {})
+    if sheet_name not in indexes or sheet_name not in wb.sheetnames:
+        if sheet_name not in wb.sheetnames:
+            ws = wb.create_sheet(sheet_name)
+            ws["A1"] = "PIN (Roll.No)"
+            ws["B1"] = "NAME"
+            ws["C1"] = "BRANCH"
+            logging.info(f"Created new sheet {sheet_name}")
+        indexes[sheet_name] = SheetIndex(wb[sheet_name])
+    return indexes[sheet_name]
+
+class Roster:
+    """Snapshot of the students table: pin -> (name, branch, course) plus each course's members."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.students = {pin: (name, branch, course) for pin, name, branch, course in rows}
+        self.by_course = {}
+        for pin, name, branch, course in sorted(rows):
+            self.by_course.setdefault(course, []).append((pin, name, branch))
+
+    def courses_for(self, pins):
+        return {self.students[pin][2] for pin in pins if pin in self.students and self.students[pin][2] != "Unknown"}
+
+roster_cache = None
+roster_lock = threading.Lock()
+
+def get_roster():
+    """Return the current Roster, reloading students only when roster_version has moved."""
+    global roster_cache
+    c = get_db().cursor()
+    c.execute("SELECT version FROM roster_version WHERE id = 1")
+    version = c.fetchone()[0]
+    roster = roster_cache
+    if roster is not None and roster.version == version:
+        return roster
+    with roster_lock:
+        if roster_cache is None or roster_cache.version != version:
+            c.execute("SELECT pin, name, branch, course FROM students")
+            roster_cache = Roster(version, c.fetchall())
+            logging.info(f"Loaded roster version {version} with {len(roster_cache.students)} students")
+        return roster_cache
 
 def log_activity(action, details):
-    conn = sqlite3.connect("database.db")
+    event = (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), action, details)
+    if ACTIVITY_LOG_SYNC:
+        write_activity([event])
+    else:
+        activity_queue.put(event)
+
+def write_activity(events):
+    conn = get_db()
+    conn.executemany("INSERT INTO activity_log (timestamp, action, details) VALUES (?, ?, ?)", events)
+    conn.commit()
+
+def activity_log_worker():
+    """Write queued events in one transaction per ACTIVITY_LOG_FLUSH_INTERVAL or ACTIVITY_LOG_BATCH events."""
+    running = True
+    while running:
+        event = activity_queue.get()
+        events = []
+        deadline = time.monotonic() + ACTIVITY_LOG_FLUSH_INTERVAL
+        while True:
+            if event is None:
+                running = False
+                break
+            events.append(event)
+            timeout = deadline - time.monotonic()
+            if len(events) >= ACTIVITY_LOG_BATCH or timeout <= 0:
+                break
+            try:
+                event = activity_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+        if events:
+            try:
+                write_activity(events)
+            except Exception as e:
+                logging.error(f"Failed to write {len(events)} activity log entries: {e}")
+            finally:
+                release_db()
+
+def stop_activity_log():
+    """Let the writer finish its batch, then write anything still queued."""
+    activity_queue.put(None)
+    activity_log_thread.join(timeout=5)
+    events = []
+    while True:
+        try:
+            event = activity_queue.get_nowait()
+        except queue.Empty:
+            break
+        if event is not None:
+            events.append(event)
+    if events:
+        write_activity(events)
+
+activity_queue = queue.Queue()
+activity_log_thread = threading.Thread(target=activity_log_worker, name="activity-log", daemon=True)
+activity_log_thread.start()
+atexit.register(stop_activity_log)
+
+def mark_attendance(pins, date, status, source):
+    """Upsert one attendance row per PIN for an ISO (YYYY-MM-DD) date and queue it for the Excel and Sheets exports.
+
+    Returns whether the change was queued for Google Sheets, which is skipped when it is not configured.
+    """
+    now = datetime.now()
+    updated_at = now.strftime("%Y-%m-%d %H:%M:%S.%f")
+    queued_at = now.strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_db()
+    c = conn.cursor()
+    c.executemany('''INSERT INTO attendance (pin, date, status, source, updated_at, exported) VALUES (?, ?, ?, ?, ?, 0)
+                     ON CONFLICT (pin, date) DO UPDATE SET status = excluded.status, source = excluded.source,
+                     updated_at = excluded.updated_at, exported = 0''',
+                  [(pin, date, status, source, updated_at) for pin in pins])
+    # Queued in the same transaction, so a committed change is never lost to a Sheets outage
+    sheets_enabled = gsheets_configured()
+    if sheets_enabled:
+        c.executemany('''INSERT INTO gsheets_outbox (course, pin, date, status, queued_at, next_attempt_at)
+                         SELECT course, pin, ?, ?, ?, ? FROM students
+                         WHERE pin = ? AND course != 'Unknown' ''',
+                      [(date, status, queued_at, queued_at, pin) for pin in pins])
+    conn.commit()
+    if sheets_enabled:
+        gsheets_sync_event.set()
+    return sheets_enabled
+
+def claim_scan_batch(session_id, seq):
+    """Record a scan batch; returns False if this (session, seq) was already processed."""
+    conn = get_db()
     c = conn.cursor()
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("INSERT INTO activity_log (timestamp, action, details) VALUES (?, ?, ?)", (timestamp, action, details))
+    now = datetime.now()
+    c.execute("INSERT OR IGNORE INTO scan_batches (session_id, seq, received_at) VALUES (?, ?, ?)",
+              (str(session_id), seq, now.strftime("%Y-%m-%d %H:%M:%S")))
+    claimed = c.rowcount == 1
+    # Scanners only replay recent batches, so forget the ones older than SCAN_BATCH_RETENTION
+    c.execute("DELETE FROM scan_batches WHERE received_at < ?", ((now - timedelta(seconds=SCAN_BATCH_RETENTION)).strftime("%Y-%m-%d %H:%M:%S"),))
+    conn.commit()
+    return claimed
+
+def release_scan_batch(session_id, seq):
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("DELETE FROM scan_batches WHERE session_id = ? AND seq = ?", (str(session_id), seq))
     conn.commit()
-    conn.close()
 
 def get_recent_activity():
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT timestamp, action, details FROM activity_log ORDER BY id DESC LIMIT 5")
     activities = c.fetchall()
-    conn.close()
     return activities
 
 # Function to append feedback to feedback.xlsx
 def append_feedback_to_excel(pin, comment, date):
+    import pandas as pd
     feedback_data = {
         'PIN': pin,
         'Comment': comment,
@@ -244,408 +1079,966 @@ def append_feedback_to_excel(pin, comment, date):
     except Exception as e:
         logging.error(f"Error writing to {FEEDBACK_EXCEL_PATH}: {e}")
 
-# Idea #3: Email Sending Function
+# Idea #3: Email sending. Messages are queued in mail_outbox and delivered by a small pool of
+# sender threads, each keeping its own authenticated SMTP connection open between messages.
+# A delivered message is removed from the outbox; one that is given up on stays as 'failed'
+def queue_email(c, to_email, subject, body):
+    """Queue a message on cursor c; it is sent once the caller commits."""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    c.execute('''INSERT INTO mail_outbox (to_email, subject, body, status, queued_at, next_attempt_at)
+                 VALUES (?, ?, ?, 'pending', ?, ?)''', (to_email, subject, body, now, now))
+
+class RateLimiter:
+    """Spaces calls to wait() at least 1/rate seconds apart across all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_at = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+smtp_local = threading.local()
+
+def get_smtp():
+    """Return this sender thread's SMTP connection, connecting and logging in on first use."""
+    server = getattr(smtp_local, "server", None)
+    if server is None:
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_STARTTLS:
+            server.starttls()
+        if server.has_extn("auth"):
+            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+        smtp_local.server = server
+        smtp_local.sent = 0
+    return server
+
+def close_smtp():
+    server = getattr(smtp_local, "server", None)
+    smtp_local.server = None
+    if server is not None:
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
 def send_email(to_email, subject, body):
+    """Send one message over this thread's pooled connection; raises on failure."""
+    msg = MIMEMultipart()
+    msg['From'] = EMAIL_ADDRESS
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    
+    mail_rate_limiter.wait()
     try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_ADDRESS
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-        
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        logging.info(f"Email sent to {to_email}: {subject}")
-        return True
+        get_smtp().send_message(msg)
+    except (smtplib.SMTPServerDisconnected, ConnectionError):
+        # The server dropped an idle pooled connection; reconnect once
+        close_smtp()
+        get_smtp().send_message(msg)
+    smtp_local.sent += 1
+    if smtp_local.sent >= SMTP_MESSAGES_PER_CONNECTION:
+        close_smtp()
+    logging.info(f"Email sent to {to_email}: {subject}")
+
+def deliver_queued_email(row_id, to_email, subject, body, attempts):
+    conn = get_db()
+    c = conn.cursor()
+    try:
+        send_email(to_email, subject, body)
     except Exception as e:
-        logging.error(f"Failed to send email to {to_email}: {e}")
-        return False
+        close_smtp()
+        # A recipient refused with a 5xx code will not be accepted on a later try either
+        refused = isinstance(e, smtplib.SMTPRecipientsRefused) and all(code >= 500 for code, _ in e.recipients.values())
+        permanent = refused or attempts + 1 >= MAIL_MAX_ATTEMPTS
+        delay = min(MAIL_RETRY_BASE * 2 ** attempts, MAIL_RETRY_MAX)
+        retry_at = (datetime.now() + timedelta(seconds=delay)).strftime("%Y-%m-%d %H:%M:%S")
+        logging.error(f"Failed to send email to {to_email}" + (": giving up" if permanent else f", retrying at {retry_at}") + f": {e}")
+        c.execute("UPDATE mail_outbox SET status = ?, attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                  ('failed' if permanent else 'pending', retry_at, str(e), row_id))
+    else:
+        c.execute("DELETE FROM mail_outbox WHERE id = ?", (row_id,))
+    finally:
+        conn.commit()
+        release_db()
+
+def send_queued_email():
+    """Claim every due message and send them on the sender pool; returns how many were attempted."""
+    conn = get_db()
+    c = conn.cursor()
+    now = datetime.now()
+    # Claim under a write lock so another worker process does not send the same messages
+    c.execute("BEGIN IMMEDIATE")
+    c.execute('''SELECT id, to_email, subject, body, attempts FROM mail_outbox
+                 WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id''', (now.strftime("%Y-%m-%d %H:%M:%S"),))
+    messages = c.fetchall()
+    lease_until = (now + timedelta(seconds=MAIL_SEND_LEASE)).strftime("%Y-%m-%d %H:%M:%S")
+    c.executemany("UPDATE mail_outbox SET next_attempt_at = ? WHERE id = ?", [(lease_until, message[0]) for message in messages])
+    conn.commit()
+    if messages:
+        logging.info(f"Sending {len(messages)} queued emails with {MAIL_WORKERS} senders")
+        futures.wait([mail_senders.submit(deliver_queued_email, *message) for message in messages])
+    return len(messages)
+
+def mail_outbox_worker():
+    while True:
+        mail_outbox_event.wait(MAIL_POLL_INTERVAL)
+        mail_outbox_event.clear()
+        try:
+            send_queued_email()
+        except Exception as e:
+            logging.error(f"Sending queued email failed: {e}")
+        finally:
+            release_db()
+
+mail_rate_limiter = RateLimiter(MAIL_RATE_LIMIT)
+mail_senders = futures.ThreadPoolExecutor(max_workers=MAIL_WORKERS, thread_name_prefix="mail-sender")
+mail_outbox_event = threading.Event()
+
+def trailing_run(mask):
+    """Per row of a 2-D bool array, the length of the run of True cells ending at the last column."""
+    import numpy as np
+    # Run length = distance from the last column back to the first cell that breaks the run
+    if not mask.shape[1]:
+        return np.zeros(mask.shape[0], dtype=np.int64)
+    breaks = ~mask[:, ::-1]
+    return np.where(breaks.any(axis=1), breaks.argmax(axis=1), mask.shape[1])
 
 # Idea #3: Check for Consecutive Absences and Send Reminders
 def check_absent_students():
+    """Remind every student absent on each of the last consecutive_days days, once per run of absences."""
+    import numpy as np
     if not config["reminders_enabled"]:
         logging.info("Attendance reminders are disabled.")
         return
     
     consecutive_days = config["consecutive_days"]
     today = datetime.now()
-    conn = sqlite3.connect("database.db")
+    # Oldest first, so today is the last column
+    check_dates = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(consecutive_days - 1, -1, -1)]
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT pin, name, email FROM students WHERE email IS NOT NULL")
     students = c.fetchall()
-    conn.close()
-    
-    if not os.path.exists(ATTENDANCE_SHEET_PATH):
-        logging.error(f"{ATTENDANCE_SHEET_PATH} not found.")
-        return
     
     try:
-        wb = openpyxl.load_workbook(ATTENDANCE_SHEET_PATH)
-        for student in students:
-            pin, name, email = student
-            consecutive_absences = 0
-            for i in range(consecutive_days):
-                check_date = (today - timedelta(days=i)).strftime("%d-%m-%Y")
-                found = False
-                for sheet_name in wb.sheetnames:
-                    ws = wb[sheet_name]
-                    date_col = get_excel_date_column(ws, check_date)
-                    if date_col:
-                        for row in range(2, ws.max_row + 1):
-                            student_pin = str(ws[f"A{row}"].value).strip('"') if ws[f"A{row}"].value else ""
-                            if student_pin == pin:
-                                status = ws.cell(row=row, column=date_col).value
-                                if status == "Absent":
-                                    consecutive_absences += 1
-                                found = True
-                                break
-                        if found:
-                            break
-                if not found:
-                    consecutive_absences += 1
-            
-            if consecutive_absences >= consecutive_days:
-                subject = "Attendance Reminder: You've Been Absent"
-                body = f"Dear {name},\n\nYou have been absent for {consecutive_absences} consecutive days. " \
-                       "Please attend classes or contact your trainer if you have any issues.\n\nBest regards,\nYour Trainer"
-                if send_email(email, subject, body):
-                    log_activity("Send Reminder", f"Sent absence reminder to {name} (PIN: {pin}) at {email}")
+        # students x days; a day with no Present row counts as absent
+        pin_rows = {pin: i for i, (pin, _, _) in enumerate(students)}
+        date_cols = {date: i for i, date in enumerate(check_dates)}
+        c.execute(f"SELECT pin, date FROM attendance WHERE status = 'Present' AND date IN ({', '.join('?' for _ in check_dates)})",
+                  check_dates)
+        marks = [(pin_rows[pin], date_cols[date]) for pin, date in c.fetchall() if pin in pin_rows]
+        present = np.zeros((len(students), consecutive_days), dtype=bool)
+        if marks:
+            rows, cols = np.array(marks, dtype=np.int64).T
+            present[rows, cols] = True
+        absent_runs = trailing_run(~present)
+        due = np.flatnonzero(absent_runs >= consecutive_days)
+        
+        # A reminder covers the run it was sent for: skip students not marked present since then
+        c.execute("""SELECT r.pin FROM absence_reminders r
+                     WHERE r.reminded_on > COALESCE((SELECT MAX(a.date) FROM attendance a WHERE a.pin = r.pin AND a.status = 'Present'), '')""")
+        already_reminded = {row[0] for row in c.fetchall()}
+        logging.info(f"Absence check over {consecutive_days} days: {len(due)} students absent throughout, "
+                     f"{sum(students[i][0] in already_reminded for i in due)} already reminded")
+        
+        for i in due:
+            pin, name, email = students[i]
+            if pin in already_reminded:
+                continue
+            consecutive_absences = int(absent_runs[i])
+            subject = "Attendance Reminder: You've Been Absent"
+            body = f"Dear {name},\n\nYou have been absent for {consecutive_absences} consecutive days. " \
+                   "Please attend classes or contact your trainer if you have any issues.\n\nBest regards,\nYour Trainer"
+            queue_email(c, email, subject, body)
+            c.execute("INSERT OR REPLACE INTO absence_reminders (pin, reminded_on) VALUES (?, ?)", (pin, check_dates[-1]))
+            conn.commit()
+            log_activity("Send Reminder", f"Queued absence reminder to {name} (PIN: {pin}) at {email}")
+        mail_outbox_event.set()
     
     except Exception as e:
         logging.error(f"Error checking absent students: {e}")
 
-# Schedule the reminder task (Idea #3)
-scheduler = BackgroundScheduler()
-scheduler.add_job(check_absent_students, 'interval', days=1, start_date=datetime.now())
-scheduler.start()
+init_db()
 
-def update_excel(scanned_pins):
-    logging.info(f"Starting update_excel with scanned_pins: {scanned_pins}")
-    try:
-        wb = openpyxl.load_workbook(ATTENDANCE_SHEET_PATH) if os.path.exists(ATTENDANCE_SHEET_PATH) else openpyxl.Workbook()
-        if not wb.sheetnames:
-            wb.remove(wb.active)
-            logging.warning(f"No sheets found in {ATTENDANCE_SHEET_PATH}, creating new workbook.")
-    except Exception as e:
-        logging.error(f"Failed to load {ATTENDANCE_SHEET_PATH}: {e}. Creating new workbook.")
-        wb = openpyxl.Workbook()
-        wb.remove(wb.active)
-    
-    today_date = datetime.now().strftime("%d-%m-%Y")
-    scanned_pins_set = set(scanned_pins)
-    logging.info(f"Processing attendance for date: {today_date} with {len(scanned_pins_set)} unique pins")
-    
-    conn = sqlite3.connect("database.db")
+threading.Thread(target=mail_outbox_worker, name="mail-outbox", daemon=True).start()
+
+class LeaderScheduler:
+    """Runs interval jobs in whichever process holds the scheduler lease in SQLite.
+
+    Every process tries to take or renew the lease each SCHEDULER_POLL_INTERVAL seconds and only
+    the holder looks at its jobs, so N gunicorn workers still run each job once. A job is due one
+    interval after its last recorded start, which also means a run missed while no process was up
+    happens once, as soon as a leader is back.
+
+    The Excel export flush also waits for is_leader, since every process would otherwise rewrite
+    the same ATTENDANCE_SHEET_PATH (Attendence_data.xlsx). The other background threads run in
+    every process on purpose: the Sheets sync, mail and bulk-upload workers claim their rows under
+    BEGIN IMMEDIATE with a lease, so each row is handled once, and the activity-log writer drains
+    this process's own in-memory queue.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.holder = None
+        self.is_leader = False
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def add_job(self, func, interval):
+        self.jobs[func.__name__] = (func, interval)
+
+    def start(self):
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.thread = threading.Thread(target=self.run, name="scheduler", daemon=True)
+        self.thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self, wait=True):
+        self.stop_event.set()
+        if wait and self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+        if self.is_leader:
+            # Hand over at once instead of making the next leader wait out the lease
+            conn = get_db()
+            conn.execute("UPDATE scheduler_lease SET expires_at = '' WHERE id = 1 AND holder = ?", (self.holder,))
+            conn.commit()
+            self.is_leader = False
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                if self.acquire_lease():
+                    self.run_due_jobs()
+            except Exception as e:
+                logging.error(f"Scheduler tick failed: {e}")
+            finally:
+                release_db()
+            self.stop_event.wait(SCHEDULER_POLL_INTERVAL)
+
+    def acquire_lease(self):
+        now = datetime.now()
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('''UPDATE scheduler_lease SET holder = ?, expires_at = ?
+                     WHERE id = 1 AND (holder = ? OR expires_at < ?)''',
+                  (self.holder, (now + timedelta(seconds=SCHEDULER_LEASE_TTL)).strftime("%Y-%m-%d %H:%M:%S"),
+                   self.holder, now.strftime("%Y-%m-%d %H:%M:%S")))
+        is_leader = c.rowcount == 1
+        conn.commit()
+        if is_leader != self.is_leader:
+            logging.info(f"Scheduler {self.holder} {'is now the leader' if is_leader else 'lost the lease'}")
+        self.is_leader = is_leader
+        return is_leader
+
+    def run_due_jobs(self):
+        c = get_db().cursor()
+        for name, (func, interval) in self.jobs.items():
+            c.execute("SELECT MAX(started_at) FROM job_runs WHERE job = ?", (name,))
+            last_started = c.fetchone()[0]
+            if last_started:
+                due_at = datetime.strptime(last_started, "%Y-%m-%d %H:%M:%S") + interval
+                if datetime.now() < due_at:
+                    continue
+                if datetime.now() - due_at > timedelta(seconds=SCHEDULER_LEASE_TTL):
+                    logging.info(f"Catching up on job {name}, due since {due_at.strftime('%Y-%m-%d %H:%M:%S')}")
+            self.run_job(name, func)
+
+    def run_job(self, name, func):
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("INSERT INTO job_runs (job, started_at, outcome) VALUES (?, ?, 'running')",
+                  (name, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        run_id = c.lastrowid
+        conn.commit()
+        start = time.perf_counter()
+        outcome, error = "success", None
+        try:
+            func()
+        except Exception as e:
+            outcome, error = "error", str(e)
+            logging.error(f"Scheduled job {name} failed: {e}")
+        finally:
+            release_db()
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        c.execute("UPDATE job_runs SET finished_at = ?, duration_ms = ?, outcome = ?, error = ? WHERE id = ?",
+                  (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), duration_ms, outcome, error, run_id))
+        conn.commit()
+        logging.info(f"Scheduled job {name} finished in {duration_ms} ms: {outcome}")
+
+def get_last_job_run(name):
+    """Return (started_at, duration_ms, outcome) for the job's latest run, or None."""
+    c = get_db().cursor()
+    c.execute("SELECT started_at, duration_ms, outcome FROM job_runs WHERE job = ? ORDER BY id DESC LIMIT 1", (name,))
+    return c.fetchone()
+
+@app.cli.command("job-runs")
+def job_runs_command():
+    """Show the most recent scheduled job runs."""
+    c = get_db().cursor()
+    c.execute("SELECT job, started_at, finished_at, duration_ms, outcome, error FROM job_runs ORDER BY id DESC LIMIT 20")
+    for job, started_at, finished_at, duration_ms, outcome, error in c.fetchall():
+        print(f"{started_at}  {job:<24} {outcome:<8} {duration_ms if duration_ms is not None else '-':>8} ms  {error or ''}")
+    c.execute("SELECT holder, expires_at FROM scheduler_lease WHERE id = 1")
+    holder, expires_at = c.fetchone()
+    print(f"Scheduler lease: {holder or 'nobody'} until {expires_at or '-'}")
+
+# Schedule the reminder task (Idea #3); only the lease holder runs it
+scheduler = LeaderScheduler()
+scheduler.add_job(check_absent_students, timedelta(days=1))
+if SCHEDULER_ENABLED:
+    scheduler.start()
+
+def flush_excel_export():
+    """Apply all attendance rows not yet exported to the workbook with one load/save."""
+    with excel_flush_lock:
+        lock_file = open(f"{ATTENDANCE_SHEET_PATH}.lock", "w")
+        try:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            conn = get_db()
+            c = conn.cursor()
+            c.execute("SELECT pin, date, status, updated_at FROM attendance WHERE exported = 0")
+            changes = c.fetchall()
+            if not changes:
+                return True
+            logging.info(f"Flushing {len(changes)} attendance changes to {ATTENDANCE_SHEET_PATH}")
+
+            roster = get_roster()
+            changes_by_sheet = {}
+            for pin, date, status, _ in changes:
+                if pin in roster.students and roster.students[pin][2] != "Unknown":
+                    changes_by_sheet.setdefault((roster.students[pin][2], date), {})[pin] = status
+            courses = {course for course, _ in changes_by_sheet}
+
+            try:
+                with cached_workbook(ATTENDANCE_SHEET_PATH) as wb:
+                    for (course, date), statuses in changes_by_sheet.items():
+                        index = get_sheet_index(wb, course)
+                        date_col = index.date_column(datetime.strptime(date, "%Y-%m-%d").strftime("%d-%m-%Y"), create=True)
+                        for pin, name, branch in roster.by_course.get(course, []):
+                            index.add_student(pin, name, branch)
+
+                        for pin, row in index.pin_rows.items():
+                            cell = index.ws.cell(row=row, column=date_col)
+                            if pin in statuses:
+                                cell.value = statuses[pin]
+                            elif not cell.value:
+                                cell.value = "Absent"
+
+                    save_cached_workbook(ATTENDANCE_SHEET_PATH, wb)
+            except PermissionError as e:
+                logging.error(f"Permission denied while saving {ATTENDANCE_SHEET_PATH}: {e}. Ensure file is not open.")
+                return False
+            except Exception as e:
+                logging.error(f"Failed to save {ATTENDANCE_SHEET_PATH}: {e}")
+                return False
+
+            # Rows changed again while we were writing keep exported = 0 and go out with the next flush
+            c.executemany("UPDATE attendance SET exported = 1 WHERE pin = ? AND date = ? AND updated_at = ?",
+                          [(pin, date, updated_at) for pin, date, _, updated_at in changes])
+            c.execute("INSERT OR REPLACE INTO export_state (target, last_flushed_at) VALUES ('excel', ?)",
+                      (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+            conn.commit()
+            logging.info(f"Successfully flushed {len(changes)} attendance changes to {ATTENDANCE_SHEET_PATH}")
+            refresh_attendance_matrices(courses)
+            return True
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+def excel_flush_worker():
+    last_check = time.monotonic()
+    while True:
+        time.sleep(EXCEL_FLUSH_CHECK_INTERVAL)
+        # Every worker marks rows exported = 0; only the scheduler leader writes them to the workbook
+        if not scheduler.is_leader:
+            continue
+        try:
+            pending = count_unexported_attendance()
+            if pending >= EXCEL_FLUSH_BATCH or time.monotonic() - last_check >= EXCEL_FLUSH_INTERVAL:
+                last_check = time.monotonic()
+                if pending:
+                    flush_excel_export()
+        except Exception as e:
+            logging.error(f"Excel export flush failed: {e}")
+        finally:
+            release_db()
+
+def get_excel_export_status():
+    conn = get_db()
     c = conn.cursor()
-    c.execute("SELECT pin, name, branch, course FROM students")
-    db_students = {row[0]: (row[1], row[2], row[3]) for row in c.fetchall()}
-    conn.close()
-    
-    students_by_course = {}
-    for pin, (name, branch, course) in db_students.items():
-        if course not in students_by_course:
-            students_by_course[course] = []
-        students_by_course[course].append((pin, name, branch))
-    
-    scanned_courses = set()
-    for pin in scanned_pins_set:
-        if pin in db_students:
-            course = db_students[pin][2]
-            if course != "Unknown":
-                scanned_courses.add(course)
-    
-    for course in scanned_courses:
-        students = students_by_course.get(course, [])
-        
-        if course not in wb.sheetnames:
-            ws = wb.create_sheet(course)
-            ws["A1"] = "PIN (Roll.No)"
-            ws["B1"] = "NAME"
-            ws["C1"] = "BRANCH"
-            logging.info(f"Created new sheet in {ATTENDANCE_SHEET_PATH}: {course}")
+    c.execute("SELECT last_flushed_at FROM export_state WHERE target = 'excel'")
+    row = c.fetchone()
+    return (row[0] if row else None), count_unexported_attendance()
+
+def count_unexported_attendance():
+    c = get_db().cursor()
+    c.execute("SELECT COUNT(*) FROM attendance WHERE exported = 0")
+    return c.fetchone()[0]
+
+def flush_excel_export_on_exit():
+    # Registered after scheduler.shutdown, so it runs first, while this process may still be the leader
+    if scheduler.is_leader:
+        flush_excel_export()
+
+excel_flush_lock = threading.Lock()
+threading.Thread(target=excel_flush_worker, name="excel-export", daemon=True).start()
+atexit.register(flush_excel_export_on_exit)
+
+# Per-course students x dates matrices (0 = not marked, 1 = present, 2 = absent) stored as .npy files
+# under MATRIX_DIR and opened with mmap, so every worker shares the same pages
+ATTENDANCE_CODES = {"Present": 1, "Absent": 2}
+attendance_matrix_cache = {}
+
+def get_matrix_paths(course):
+    # Keyed on a hash of the exact course name: sanitized names collide ("A&B" and "AB")
+    name = hashlib.sha1(course.encode("utf-8")).hexdigest()
+    return os.path.join(MATRIX_DIR, f"{name}.npy"), os.path.join(MATRIX_DIR, f"{name}.json")
+
+def build_attendance_matrix(course):
+    import numpy as np
+    roster = get_roster()
+    students = [(pin, branch) for pin, _, branch in roster.by_course.get(course, [])]
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT a.pin, a.date, a.status FROM attendance a JOIN students s ON s.pin = a.pin WHERE s.course = ?", (course,))
+    records = c.fetchall()
+
+    pins = [pin for pin, _ in students]
+    pin_rows = {pin: i for i, pin in enumerate(pins)}
+    # Students added since the roster was loaded are picked up by the rebuild their version bump causes
+    records = [record for record in records if record[0] in pin_rows]
+    dates = sorted({date for _, date, _ in records})
+    date_cols = {date: i for i, date in enumerate(dates)}
+    records = [(pin_rows[pin], date_cols[date], ATTENDANCE_CODES.get(status, 0)) for pin, date, status in records]
+
+    os.makedirs(MATRIX_DIR, exist_ok=True)
+    matrix_path, meta_path = get_matrix_paths(course)
+    # Several workers may rebuild the same course at once; each writes its own temp files
+    suffix = f".{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(f"{meta_path}{suffix}", "w") as f:
+        json.dump({"course": course, "roster_version": roster.version, "pins": pins,
+                   "branches": [branch for _, branch in students], "dates": dates}, f)
+    matrix = np.lib.format.open_memmap(f"{matrix_path}{suffix}", mode="w+", dtype=np.uint8, shape=(len(pins), len(dates)))
+    if records:
+        rows, cols, codes = np.array(records, dtype=np.int64).T
+        matrix[rows, cols] = codes
+    matrix.flush()
+    del matrix
+    os.replace(f"{meta_path}{suffix}", meta_path)
+    os.replace(f"{matrix_path}{suffix}", matrix_path)
+    logging.info(f"Built attendance matrix for {course}: {len(pins)} students x {len(dates)} dates")
+
+def refresh_attendance_matrices(courses):
+    for course in courses:
+        try:
+            build_attendance_matrix(course)
+        except Exception as e:
+            logging.error(f"Failed to build attendance matrix for {course}: {e}")
+
+def load_attendance_matrix(course):
+    """Return (pins, branches, dates, matrix) for a course, building the matrix on first use.
+
+    The matrix is rebuilt when the roster has changed since it was built (roster_version moved).
+    """
+    import numpy as np
+    version = get_roster().version
+    matrix_path, meta_path = get_matrix_paths(course)
+    if not os.path.exists(matrix_path) or not os.path.exists(meta_path):
+        build_attendance_matrix(course)
+    stamp = get_file_stamp(matrix_path)
+    cached = attendance_matrix_cache.get(course)
+    if cached and cached[0] == (stamp, version):
+        return cached[1]
+    with open(meta_path) as f:
+        meta = json.load(f)
+    matrix = np.load(matrix_path, mmap_mode="r")
+    if meta.get("roster_version") != version or matrix.shape != (len(meta["pins"]), len(meta["dates"])):
+        # Built from an older roster, or metadata and matrix were caught mid-rebuild; rebuild both
+        build_attendance_matrix(course)
+        return load_attendance_matrix(course)
+    entry = (meta["pins"], np.array(meta["branches"], dtype=object), meta["dates"], matrix)
+    attendance_matrix_cache[course] = ((stamp, version), entry)
+    return entry
+
+def get_course_analytics(course):
+    import numpy as np
+    pins, branches, dates, matrix = load_attendance_matrix(course)
+    total_days = len(dates)
+    present = matrix == 1
+    present_days = present.sum(axis=1)
+    percentages = present_days * 100.0 / total_days if total_days else np.zeros(len(pins))
+
+    present_streaks = trailing_run(present)
+    # Unmarked days (code 0) break an absence streak rather than extend it
+    absent_streaks = trailing_run(matrix == ATTENDANCE_CODES["Absent"])
+
+    branch_names, branch_idx = np.unique(branches.astype(str), return_inverse=True) if len(pins) else (np.array([]), np.array([], dtype=np.int64))
+    branch_students = np.bincount(branch_idx, minlength=len(branch_names))
+    branch_present = np.bincount(branch_idx, weights=present_days, minlength=len(branch_names))
+    branch_percentages = branch_present * 100.0 / (branch_students * total_days) if total_days else np.zeros(len(branch_names))
+
+    return {
+        "course": course,
+        "dates": [datetime.strptime(date, "%Y-%m-%d").strftime("%d-%m-%Y") for date in dates],
+        "daily_present": present.sum(axis=0).tolist(),
+        "students": [
+            {"pin": pin, "percentage": round(float(pct), 2), "present_days": int(days),
+             "present_streak": int(p_streak), "absent_streak": int(a_streak)}
+            for pin, pct, days, p_streak, a_streak in zip(pins, percentages, present_days, present_streaks, absent_streaks)
+        ],
+        "branches": {str(name): round(float(pct), 2) for name, pct in zip(branch_names, branch_percentages)},
+    }
+
+def plan_tab_writes(all_data, changes, students):
+    """Apply [(dd-mm-YYYY date, {pin: status})] to a copy of one tab's values.
+
+    Adds missing date headers and roster students, sets the given statuses and fills Absent into
+    empty cells, like the Excel export. Returns the updated grid and the {(row, col): value} cells
+    that differ from all_data.
+    """
+    grid = [list(row) for row in all_data]
+    cells = {}
+
+    def set_cell(row, col, value):
+        while len(grid) < row:
+            grid.append([])
+        cells_row = grid[row-1]
+        cells_row.extend([""] * (col - len(cells_row)))
+        cells_row[col-1] = value
+        cells[(row, col)] = value
+
+    if not grid:
+        for col, header in enumerate(['PIN (Roll.No)', 'NAME', 'BRANCH'], 1):
+            set_cell(1, col, header)
+    pin_rows = {}
+    for row_idx, row in enumerate(grid[1:], start=2):
+        pin = str(row[0]).strip('"') if row else ""
+        if pin:
+            pin_rows.setdefault(pin, row_idx)
+
+    for date_str, statuses in changes:
+        headers = grid[0]
+        if date_str in headers:
+            date_col = headers.index(date_str) + 1
         else:
-            ws = wb[course]
-        
-        date_col = get_excel_date_column(ws, today_date)
-        if not date_col:
-            date_col = ws.max_column + 1 if ws.max_column >= 4 else 4
-            ws.cell(row=1, column=date_col).value = today_date
-            logging.info(f"Added new date column {today_date} at column {date_col} in sheet {course}")
-        
-        sheet_pin_map = {str(ws[f"A{row}"].value).strip('"'): row for row in range(2, ws.max_row + 1) if ws[f"A{row}"].value}
+            date_col = len(headers) + 1
+            set_cell(1, date_col, date_str)
         for pin, name, branch in students:
-            if pin not in sheet_pin_map:
-                next_row = ws.max_row + 1
-                ws[f"A{next_row}"] = pin
-                ws[f"B{next_row}"] = name
-                ws[f"C{next_row}"] = branch
-                sheet_pin_map[pin] = next_row
-        
-        for row in range(2, ws.max_row + 1):
-            pin = str(ws[f"A{row}"].value).strip('"') if ws[f"A{row}"].value else ""
-            if pin:
-                cell = ws.cell(row=row, column=date_col)
-                if pin in scanned_pins_set:
-                    cell.value = "Present"
-                    logging.info(f"Marked {pin} as Present in {course} for {today_date}")
-                else:
-                    if not cell.value:
-                        cell.value = "Absent"
-                        logging.info(f"Marked {pin} as Absent in {course} for {today_date}")
-    
-    try:
-        wb.save(ATTENDANCE_SHEET_PATH)
-        logging.info(f"Successfully updated {ATTENDANCE_SHEET_PATH} with {len(scanned_pins)} new scans for {today_date}")
-        return True
-    except PermissionError as e:
-        logging.error(f"Permission denied while saving {ATTENDANCE_SHEET_PATH}: {e}. Ensure file is not open.")
-        return False
-    except Exception as e:
-        logging.error(f"Failed to save {ATTENDANCE_SHEET_PATH}: {e}")
-        return False
+            if pin not in pin_rows:
+                pin_rows[pin] = len(grid) + 1
+                set_cell(pin_rows[pin], 1, pin)
+                set_cell(pin_rows[pin], 2, name)
+                set_cell(pin_rows[pin], 3, branch)
+        for pin, row_idx in pin_rows.items():
+            row = grid[row_idx-1]
+            cell_value = row[date_col-1] if len(row) > date_col-1 else ""
+            value = statuses.get(pin) or (None if cell_value else "Absent")
+            if value and value != cell_value:
+                set_cell(row_idx, date_col, value)
+    return grid, cells
 
-def update_google_sheets(scanned_pins):
-    sheet = initialize_gsheets()
-    if not sheet:
-        return False
-    
-    today_date = datetime.now().strftime("%d-%m-%Y")
-    scanned_pins_set = set(scanned_pins)
-    
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-    c.execute("SELECT pin, name, branch, course FROM students")
-    db_students = {row[0]: (row[1], row[2], row[3]) for row in c.fetchall()}
-    conn.close()
-    
-    students_by_course = {}
-    for pin, (name, branch, course) in db_students.items():
-        if course not in students_by_course:
-            students_by_course[course] = []
-        students_by_course[course].append((pin, name, branch))
-    
-    scanned_courses = set()
-    for pin in scanned_pins_set:
-        if pin in db_students:
-            course = db_students[pin][2]
-            if course != "Unknown":
-                scanned_courses.add(course)
-    
-    for course in scanned_courses:
-        students = students_by_course.get(course, [])
+def send_values_batch_update(sheet, data):
+    """Send data in one values_batch_update, halving it while it is over GSHEETS_MAX_PAYLOAD or rejected as too large.
+
+    Returns the number of requests made.
+    """
+    import gspread
+    if len(data) < 2 or len(json.dumps(data)) <= GSHEETS_MAX_PAYLOAD:
+        try:
+            sheet.values_batch_update({"valueInputOption": "RAW", "data": data})
+            return 1
+        except gspread.exceptions.APIError as e:
+            if len(data) < 2 or e.code != 413:
+                raise
+    mid = len(data) // 2
+    logging.warning(f"Google Sheets update with {len(data)} ranges is too large, splitting it")
+    return send_values_batch_update(sheet, data[:mid]) + send_values_batch_update(sheet, data[mid:])
+
+def push_gsheets_changes(changes, roster):
+    """Write {(course, ISO date): {pin: status}} to Google Sheets.
+
+    Every affected tab, across all courses in changes, is read with one values_batch_get, and all
+    header, status and new-row writes go out in one spreadsheet-level values_batch_update, with one
+    column range per date column touched. Only new tabs and grids that need more rows or columns
+    cost extra calls.
+    """
+    from gspread.utils import rowcol_to_a1, absolute_range_name
+    sheet = gsheets.get_spreadsheet()
+    if sheet is None:
+        raise RuntimeError("Google Sheets is unavailable")
+    tabs = {}
+    for (course, date), statuses in changes.items():
         sheet_name = sanitize_sheet_name(course, for_google_sheets=True)
-        
+        if sheet_name not in tabs:
+            students = roster.by_course.get(course, [])
+            ws = gsheets.worksheet(sheet_name) or gsheets.add_worksheet(sheet_name, rows=len(students) + 10, cols=20)
+            if ws is None:
+                raise RuntimeError("Google Sheets is unavailable")
+            tabs[sheet_name] = (ws, [], students)
+        tabs[sheet_name][1].append((datetime.strptime(date, "%Y-%m-%d").strftime("%d-%m-%Y"), statuses))
+
+    titles = list(tabs)
+    response = sheet.values_batch_get([absolute_range_name(title) for title in titles])
+    data = []
+    grow = []
+    for title, value_range in zip(titles, response.get("valueRanges", [])):
+        ws, dated_changes, students = tabs[title]
+        all_data = value_range.get("values", [])
+        grid, cells = plan_tab_writes(all_data, dated_changes, students)
+        if not cells:
+            continue
+        # Changes in existing rows go out as one column range per touched column (the date column,
+        # from its header down); appended rows go out as a single block
+        first_new_row = len(all_data) + 1
+        spans = {}
+        for row, col in cells:
+            if row < first_new_row:
+                top, bottom = spans.get(col, (row, row))
+                spans[col] = (min(top, row), max(bottom, row))
+        for col, (top, bottom) in sorted(spans.items()):
+            values = [[grid[row-1][col-1] if len(grid[row-1]) >= col else ""] for row in range(top, bottom + 1)]
+            data.append({"range": absolute_range_name(title, f"{rowcol_to_a1(top, col)}:{rowcol_to_a1(bottom, col)}"), "values": values})
+        if len(grid) >= first_new_row:
+            width = max(len(row) for row in grid[first_new_row-1:])
+            block = f"{rowcol_to_a1(first_new_row, 1)}:{rowcol_to_a1(len(grid), width)}"
+            data.append({"range": absolute_range_name(title, block), "values": grid[first_new_row-1:]})
+
+        width = max(len(row) for row in grid)
+        if len(grid) > ws.row_count:
+            grow.append({"appendDimension": {"sheetId": ws.id, "dimension": "ROWS", "length": len(grid) - ws.row_count}})
+        if width > ws.col_count:
+            grow.append({"appendDimension": {"sheetId": ws.id, "dimension": "COLUMNS", "length": width - ws.col_count}})
+
+    if grow:
+        sheet.batch_update({"requests": grow})
+        # The cached worksheets still report the old grid size
+        gsheets.invalidate()
+    requests = send_values_batch_update(sheet, data) if data else 0
+    logging.info(f"Synced {len(changes)} course/date batches to {len(titles)} Google Sheet tabs: "
+                 f"{len(data)} ranges in {requests} update request(s)")
+
+def sync_gsheets_outbox():
+    """Push all due gsheets_outbox rows in one planned write.
+
+    If that fails for a reason other than quota or an outage, each (course, date) group is pushed on
+    its own, so only the groups whose tab is at fault back off.
+    """
+    with gsheets_sync_lock:
+        conn = get_db()
+        c = conn.cursor()
+        now = datetime.now()
+        # Claim the due rows under a write lock so another worker process does not push them too
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("SELECT id, course, pin, date, status, attempts FROM gsheets_outbox WHERE failed = 0 AND next_attempt_at <= ? ORDER BY id",
+                  (now.strftime("%Y-%m-%d %H:%M:%S"),))
+        rows = c.fetchall()
+        lease_until = (now + timedelta(seconds=GSHEETS_SYNC_LEASE)).strftime("%Y-%m-%d %H:%M:%S")
+        c.executemany("UPDATE gsheets_outbox SET next_attempt_at = ? WHERE id = ?", [(lease_until, row[0]) for row in rows])
+        conn.commit()
+        if not rows:
+            return True
+
+        # Rows are in queue order, so the last status queued for a PIN wins
+        groups = {}
+        for row_id, course, pin, date, status, attempts in rows:
+            group = groups.setdefault((course, date), {"ids": [], "statuses": {}, "attempts": 0})
+            group["ids"].append(row_id)
+            group["statuses"][pin] = status
+            group["attempts"] = max(group["attempts"], attempts)
+        logging.info(f"Syncing {len(rows)} queued attendance changes to Google Sheets ({len(groups)} course/date batches)")
+
+        roster = get_roster()
         try:
-            ws = None
-            for worksheet in sheet.worksheets():
-                if worksheet.title == sheet_name:
-                    ws = worksheet
-                    break
-            if not ws:
-                ws = sheet.add_worksheet(title=sheet_name, rows=len(students) + 10, cols=20)
-                ws.update('A1:C1', [['PIN (Roll.No)', 'NAME', 'BRANCH']])
-            
-            headers = ws.row_values(1)
-            date_col = None
-            for i, header in enumerate(headers, 1):
-                if header == today_date:
-                    date_col = i
-                    break
-            if not date_col:
-                date_col = len(headers) + 1
-                ws.update_cell(1, date_col, today_date)
-            
-            existing_present = set()
-            all_data = ws.get_all_values()
-            if len(all_data) < 2:
-                all_data.append([''] * len(headers))
-            
-            for row in all_data[1:]:
-                pin = str(row[0]).strip('"') if row else ""
-                if pin and len(row) >= date_col:
-                    status = row[date_col-1]
-                    if status == "Present":
-                        existing_present.add(pin)
-            
-            all_present = existing_present.union(scanned_pins_set)
-            
-            sheet_pins = {row[0].strip('"') for row in all_data[1:] if row and row[0]}
-            updates = []
-            for row_idx, row in enumerate(all_data[1:], start=2):
-                pin = row[0].strip('"') if row else ""
-                if not pin:
-                    continue
-                cell_value = row[date_col-1] if len(row) > date_col-1 else ""
-                if pin in all_present:
-                    if cell_value != "Present":
-                        updates.append({
-                            "range": f"{chr(64 + date_col)}{row_idx}",
-                            "values": [["Present"]]
-                        })
-                else:
-                    if not cell_value:
-                        updates.append({
-                            "range": f"{chr(64 + date_col)}{row_idx}",
-                            "values": [["Absent"]]
-                        })
-            
-            new_rows = []
-            for pin, name, branch in students:
-                if pin not in sheet_pins:
-                    new_row = [pin, name, branch] + [""] * (date_col - 4) + ["Present" if pin in all_present else "Absent"]
-                    new_rows.append(new_row)
-            
-            if updates:
-                ws.batch_update(updates)
-            if new_rows:
-                ws.append_rows(new_rows)
-            logging.info(f"Updated Google Sheet '{sheet_name}' with {len(scanned_pins)} new scans, total present: {len(all_present)}")
-        
+            push_gsheets_changes({key: group["statuses"] for key, group in groups.items()}, roster)
         except Exception as e:
-            logging.error(f"Failed to update Google Sheet for course {course}: {e}")
-            continue
-    
-    return True
+            gsheets.invalidate(e)
+            if len(groups) == 1 or is_spreadsheet_wide_error(e):
+                failures = {key: e for key in groups}
+            else:
+                # Retry each (course, date) group on its own, so one failing tab only backs off its own changes
+                logging.warning(f"Combined Google Sheets push of {len(groups)} course/date batches failed, pushing them one by one: {e}")
+                failures = {}
+                for key, group in groups.items():
+                    try:
+                        push_gsheets_changes({key: group["statuses"]}, roster)
+                    except Exception as group_error:
+                        gsheets.invalidate(group_error)
+                        failures[key] = group_error
+        else:
+            failures = {}
+
+        for (course, date), group in groups.items():
+            e = failures.get((course, date))
+            if e is None:
+                c.executemany("DELETE FROM gsheets_outbox WHERE id = ?", [(row_id,) for row_id in group["ids"]])
+                continue
+            failed = group["attempts"] + 1 >= GSHEETS_MAX_ATTEMPTS
+            if failed:
+                logging.error(f"Giving up on {len(group['ids'])} Google Sheets changes for {course} on {date} after {GSHEETS_MAX_ATTEMPTS} attempts: {e}")
+            else:
+                logging.error(f"Failed to sync {len(group['ids'])} attendance changes for {course} on {date} to Google Sheets: {e}")
+            delay = min(GSHEETS_RETRY_BASE * 2 ** group["attempts"], GSHEETS_RETRY_MAX)
+            retry_at = (datetime.now() + timedelta(seconds=delay)).strftime("%Y-%m-%d %H:%M:%S")
+            c.executemany("UPDATE gsheets_outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?, failed = ? WHERE id = ?",
+                          [(retry_at, str(e), int(failed), row_id) for row_id in group["ids"]])
+        if len(failures) < len(groups):
+            c.execute("INSERT OR REPLACE INTO export_state (target, last_flushed_at) VALUES ('gsheets', ?)",
+                      (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+        conn.commit()
+        return not failures
+
+def gsheets_sync_worker():
+    while True:
+        gsheets_sync_event.wait(GSHEETS_SYNC_INTERVAL)
+        gsheets_sync_event.clear()
+        try:
+            sync_gsheets_outbox()
+        except Exception as e:
+            logging.error(f"Google Sheets sync failed: {e}")
+        finally:
+            release_db()
+
+def get_gsheets_sync_status():
+    """Return (last_synced_at, pending changes, seconds the oldest pending change has waited, failed changes)."""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT last_flushed_at FROM export_state WHERE target = 'gsheets'")
+    row = c.fetchone()
+    c.execute("SELECT COUNT(*), MIN(queued_at) FROM gsheets_outbox WHERE failed = 0")
+    pending, oldest = c.fetchone()
+    c.execute("SELECT COUNT(*) FROM gsheets_outbox WHERE failed = 1")
+    failed = c.fetchone()[0]
+    lag = int((datetime.now() - datetime.strptime(oldest, "%Y-%m-%d %H:%M:%S")).total_seconds()) if oldest else 0
+    return (row[0] if row else None), pending, max(lag, 0), failed
+
+gsheets_sync_lock = threading.Lock()
+gsheets_sync_event = threading.Event()
+threading.Thread(target=gsheets_sync_worker, name="gsheets-sync", daemon=True).start()
+
+# Idea #8: Bulk uploads run as background jobs so large rosters do not hold up the request
+def read_roster_file(path):
+    import pandas as pd
+    return pd.read_csv(path) if path.endswith('.csv') else pd.read_excel(path)
+
+def queue_upload_job(file, username):
+    """Store an uploaded roster in UPLOAD_DIR and queue a job to import it; returns the job id."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(file.filename)[1].lower(), prefix="roster-", dir=UPLOAD_DIR)
+    with os.fdopen(fd, "wb") as f:
+        file.save(f)
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("INSERT INTO upload_jobs (filename, path, created_by, created_at) VALUES (?, ?, ?, ?)",
+              (file.filename, path, username, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    conn.commit()
+    upload_job_event.set()
+    return c.lastrowid
+
+class UploadLeaseLost(Exception):
+    """The job's lease expired and another worker claimed it."""
+
+def renew_upload_lease(c, job_id, owner, assignments="", params=()):
+    """Extend our lease on a running job, applying any extra SET assignments in the same UPDATE.
+
+    Raises UploadLeaseLost, leaving the caller to roll back, if the job is no longer ours.
+    """
+    lease_until = (datetime.now() + timedelta(seconds=UPLOAD_JOB_LEASE)).strftime("%Y-%m-%d %H:%M:%S")
+    c.execute(f"UPDATE upload_jobs SET {assignments}lease_expires_at = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+              (*params, lease_until, job_id, owner))
+    if c.rowcount == 0:
+        raise UploadLeaseLost(f"bulk upload {job_id} was claimed by another worker")
 
-# Idea #5: Update Excel and Google Sheets for Attendance Correction
-def update_attendance(pin, date, new_status, course):
-    # Update Excel
+def run_upload_job(job_id, path, filename, processed, owner):
+    """Import a stored roster UPLOAD_CHUNK_ROWS rows per transaction, starting after the processed rows.
+
+    Every write is made only while the job is still running under our lease (owner), which is
+    renewed with each chunk and again before the final workbook update.
+    """
+    conn = get_db()
+    c = conn.cursor()
+    finished = True
     try:
-        wb = openpyxl.load_workbook(ATTENDANCE_SHEET_PATH)
-        if course not in wb.sheetnames:
-            logging.error(f"Course {course} not found in {ATTENDANCE_SHEET_PATH}")
-            return False
-        ws = wb[course]
-        date_col = get_excel_date_column(ws, date)
-        if not date_col:
-            logging.error(f"Date {date} not found in sheet {course}")
-            return False
-        
-        for row in range(2, ws.max_row + 1):
-            student_pin = str(ws[f"A{row}"].value).strip('"') if ws[f"A{row}"].value else ""
-            if student_pin == pin:
-                ws.cell(row=row, column=date_col).value = new_status
-                break
-        
-        wb.save(ATTENDANCE_SHEET_PATH)
+        df = read_roster_file(path)
+        missing_cols = [col for col in ROSTER_COLUMNS if col not in df.columns]
+        if missing_cols:
+            raise ValueError(f"Sheet is missing required columns: {', '.join(missing_cols)}")
+        renew_upload_lease(c, job_id, owner, "total_rows = ?, ", (len(df),))
+        conn.commit()
+        for start in range(processed, len(df), UPLOAD_CHUNK_ROWS):
+            chunk = df.iloc[start:start + UPLOAD_CHUNK_ROWS]
+            students, rejected = clean_roster(chunk)
+            errors = list(rejected[["row", "pin", "name", "branch", "course", "reason"]].itertuples(index=False, name=None))
+            try:
+                imported = save_students(c, students, update_existing=True)
+            except Exception as e:
+                conn.rollback()
+                imported = 0
+                errors += [(*student, f"Database error: {e}") for student in
+                           students[["row", "pin", "name", "branch", "course"]].itertuples(index=False, name=None)]
+            c.executemany("INSERT INTO upload_job_errors (job_id, row, pin, name, branch, course, reason) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          [(job_id, int(row), *rest) for row, *rest in errors])
+            renew_upload_lease(c, job_id, owner, "processed_rows = ?, imported_rows = imported_rows + ?, skipped_rows = skipped_rows + ?, error_rows = error_rows + ?, ",
+                               (start + len(chunk), imported, len(rejected), len(errors) - len(rejected)))
+            conn.commit()
+        # a.xlsx is updated once at the end; saving it per chunk would cost more than the import itself
+        students, _ = clean_roster(df)
+        renew_upload_lease(c, job_id, owner)
+        conn.commit()
+        with cached_workbook(EXCEL_PATH) as wb:
+            added_count = add_students_to_workbook(wb, students)
+            save_cached_workbook(EXCEL_PATH, wb)
+        renew_upload_lease(c, job_id, owner, "status = 'done', added_rows = ?, finished_at = ?, ",
+                           (added_count, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        conn.commit()
+        logging.info(f"Bulk upload {job_id} of {filename}: {len(df)} rows, {len(students)} students saved, {added_count} added to {EXCEL_PATH}")
+        log_activity("Bulk Upload", f"Added {added_count} students via bulk upload of {filename}")
+    except UploadLeaseLost as e:
+        # The new owner carries on from the last committed chunk and needs the stored file
+        conn.rollback()
+        finished = False
+        logging.warning(f"Stopped {e}")
     except Exception as e:
-        logging.error(f"Failed to update Excel attendance for PIN {pin}: {e}")
-        return False
-    
-    # Update Google Sheets
-    sheet = initialize_gsheets()
-    if not sheet:
-        return False
-    
-    sheet_name = sanitize_sheet_name(course, for_google_sheets=True)
+        conn.rollback()
+        logging.error(f"Bulk upload {job_id} of {filename} failed: {e}")
+        c.execute("UPDATE upload_jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ? AND lease_owner = ?",
+                  (str(e), datetime.now().strftime("%Y-%m-%d %H:%M:%S"), job_id, owner))
+        finished = c.rowcount > 0
+        conn.commit()
+    finally:
+        release_db()
+        with upload_jobs_lock:
+            active_upload_jobs.discard(job_id)
+        upload_job_event.set()
+    if finished and os.path.exists(path):
+        os.remove(path)
+
+def claim_upload_jobs():
+    """Claim queued (or abandoned) jobs for the idle upload workers; returns how many were started."""
+    with upload_jobs_lock:
+        free = UPLOAD_WORKERS - len(active_upload_jobs)
+    if free <= 0:
+        return 0
+    conn = get_db()
+    c = conn.cursor()
+    now = datetime.now()
+    # Claim under a write lock so another worker process does not import the same file
+    c.execute("BEGIN IMMEDIATE")
+    c.execute('''SELECT id, path, filename, processed_rows FROM upload_jobs
+                 WHERE status = 'queued' OR (status = 'running' AND lease_expires_at <= ?)
+                 ORDER BY id LIMIT ?''', (now.strftime("%Y-%m-%d %H:%M:%S"), free))
+    jobs = c.fetchall()
+    lease_until = (now + timedelta(seconds=UPLOAD_JOB_LEASE)).strftime("%Y-%m-%d %H:%M:%S")
+    # Each claim gets its own owner token, so a worker whose lease lapsed cannot write over the new owner's progress
+    jobs = [(*job, uuid.uuid4().hex) for job in jobs]
+    c.executemany("UPDATE upload_jobs SET status = 'running', started_at = COALESCE(started_at, ?), lease_expires_at = ?, lease_owner = ? WHERE id = ?",
+                  [(now.strftime("%Y-%m-%d %H:%M:%S"), lease_until, job[4], job[0]) for job in jobs])
+    conn.commit()
+    for job in jobs:
+        with upload_jobs_lock:
+            active_upload_jobs.add(job[0])
+        upload_workers.submit(run_upload_job, *job)
+    return len(jobs)
+
+def upload_job_worker():
+    while True:
+        upload_job_event.wait(UPLOAD_POLL_INTERVAL)
+        upload_job_event.clear()
+        try:
+            claim_upload_jobs()
+        except Exception as e:
+            logging.error(f"Starting bulk upload jobs failed: {e}")
+        finally:
+            release_db()
+
+UPLOAD_JOB_FIELDS = ["id", "filename", "status", "created_at", "finished_at", "total_rows", "processed_rows",
+                     "imported_rows", "skipped_rows", "error_rows", "added_rows", "error"]
+
+def get_upload_job(job_id):
+    c = get_db().cursor()
+    c.execute(f"SELECT {', '.join(UPLOAD_JOB_FIELDS)} FROM upload_jobs WHERE id = ?", (job_id,))
+    row = c.fetchone()
+    return dict(zip(UPLOAD_JOB_FIELDS, row)) if row else None
+
+upload_workers = futures.ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="bulk-upload")
+upload_jobs_lock = threading.Lock()
+active_upload_jobs = set()
+upload_job_event = threading.Event()
+threading.Thread(target=upload_job_worker, name="upload-jobs", daemon=True).start()
+
+# Idea #5: Record an attendance correction; the Excel and Google Sheets exports pick it up in the background
+def update_attendance(pin, date, new_status):
     try:
-        ws = None
-        for worksheet in sheet.worksheets():
-            if worksheet.title == sheet_name:
-                ws = worksheet
-                break
-        if not ws:
-            logging.error(f"Sheet {sheet_name} not found in Google Sheets")
-            return False
-        
-        all_data = ws.get_all_values()
-        if len(all_data) < 1:
-            return False
-        
-        headers = all_data[0]
-        date_col = None
-        for i, header in enumerate(headers, 1):
-            if header == date:
-                date_col = i
-                break
-        if not date_col:
-            logging.error(f"Date {date} not found in Google Sheet {sheet_name}")
-            return False
-        
-        for row_idx, row in enumerate(all_data[1:], start=2):
-            student_pin = str(row[0]).strip('"') if row else ""
-            if student_pin == pin:
-                ws.update_cell(row_idx, date_col, new_status)
-                break
-        
-        logging.info(f"Updated attendance for PIN {pin} on {date} to {new_status} in both Excel and Google Sheets")
-        return True
+        gsheets_queued = mark_attendance([pin], datetime.strptime(date, "%d-%m-%Y").strftime("%Y-%m-%d"), new_status, "correction")
     except Exception as e:
-        logging.error(f"Failed to update Google Sheets attendance for PIN {pin}: {e}")
+        logging.error(f"Failed to record attendance correction for PIN {pin}: {e}")
         return False
+    logging.info(f"Updated attendance for PIN {pin} on {date} to {new_status}; queued for Excel{' and Google Sheets' if gsheets_queued else ''}")
+    return True
 
 def get_excel_attendance(date, branch=None, course=None):
     date_str = date.strftime("%d-%m-%Y")
     present_students = []
     absent_students = []
     
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
-    query = "SELECT pin, name, branch, course FROM students"
-    params = []
-    if branch and course:
-        query += " WHERE UPPER(branch) = UPPER(?) AND UPPER(course) = UPPER(?)"
-        params = [branch, course]
-    elif branch:
-        query += " WHERE UPPER(branch) = UPPER(?)"
-        params = [branch]
-    elif course:
-        query += " WHERE UPPER(course) = UPPER(?)"
-        params = [course]
-    c.execute(query, params)
-    all_students = {row[0]: (row[1], row[2], row[3]) for row in c.fetchall()}
-    
-    if not os.path.exists(ATTENDANCE_SHEET_PATH):
-        logging.error(f"{ATTENDANCE_SHEET_PATH} not found.")
-        for pin, (name, branch, course) in all_students.items():
-            absent_students.append((pin, name, branch, course))
-        conn.close()
-        return present_students, absent_students
-    
+    where, params = student_filter(branch, course, "s")
+    query = f"""SELECT s.pin, s.name, s.branch, s.course, a.status FROM students s
+                LEFT JOIN attendance a ON a.pin = s.pin AND a.date = ?{where}"""
+    params = [date.strftime("%Y-%m-%d")] + params
     try:
-        wb = openpyxl.load_workbook(ATTENDANCE_SHEET_PATH)
-        marked_students = set()
-        for sheet_name in wb.sheetnames:
-            if course and sheet_name.upper() != course.upper():
-                continue
-            ws = wb[sheet_name]
-            date_col = get_excel_date_column(ws, date_str)
-            if date_col:
-                for row in range(2, ws.max_row + 1):
-                    pin = str(ws[f"A{row}"].value).strip('"') if ws[f"A{row}"].value else ""
-                    name = ws[f"B{row}"].value or "Unknown"
-                    branch_val = ws[f"C{row}"].value or "Unknown"
-                    if branch and branch_val.upper() != branch.upper():
-                        continue
-                    status = ws.cell(row=row, column=date_col).value
-                    if pin and status:
-                        marked_students.add(pin)
-                        if status == "Present":
-                            present_students.append((pin, name, branch_val, sheet_name))
-                        elif status == "Absent":
-                            absent_students.append((pin, name, branch_val, sheet_name))
-        wb.close()
+        c.execute(query, params)
+        for pin, name, branch_val, course_val, status in c.fetchall():
+            if status == "Present":
+                present_students.append((pin, name, branch_val, course_val))
+            else:
+                absent_students.append((pin, name, branch_val, course_val))
     except Exception as e:
-        logging.error(f"Error fetching Excel attendance for {date_str}: {e}")
-        conn.close()
+        logging.error(f"Error fetching attendance for {date_str}: {e}")
         return [], []
 
-    for pin, (name, branch, course) in all_students.items():
-        if branch and branch.upper() != branch.upper():
-            continue
-        if course and course.upper() != course.upper():
-            continue
-        if pin not in marked_students:
-            absent_students.append((pin, name, branch, course))
-
-    conn.close()
     logging.info(f"get_excel_attendance for {date_str} (Branch: {branch}, Course: {course}) - Present: {len(present_students)}, Absent: {len(absent_students)}")
     return present_students, absent_students
 
+def batch_get_tabs(sheet, ranges_by_title, date_str):
+    """values_batch_get {title: [ranges]} in one call; returns {title: [value ranges]}.
+
+    If the batch fails, each tab is fetched on its own so one bad tab only loses that course.
+    """
+    titles = list(ranges_by_title)
+    try:
+        response = sheet.values_batch_get([r for title in titles for r in ranges_by_title[title]])
+        value_ranges = iter(response.get("valueRanges", []))
+        return {title: [next(value_ranges, {}) for _ in ranges_by_title[title]] for title in titles}
+    except Exception as e:
+        gsheets.invalidate(e)
+        logging.error(f"Error fetching Google Sheets attendance for {date_str} in one batch, reading tabs one by one: {e}")
+    results = {}
+    for title in titles:
+        try:
+            results[title] = sheet.values_batch_get(ranges_by_title[title]).get("valueRanges", [])
+        except Exception as e:
+            gsheets.invalidate(e)
+            logging.error(f"Error fetching Google Sheets attendance for {title} on {date_str}: {e}")
+    return results
+
 def get_gsheets_attendance(date):
+    """Return (present, absent) for a date across every course tab.
+
+    Two values_batch_get calls cover all tabs: one for the header rows, then one for the PIN, name
+    and branch columns plus the date's column of each tab that has it.
+    """
+    from gspread.utils import absolute_range_name, rowcol_to_a1
     sheet = initialize_gsheets()
     if not sheet:
         return [], []
@@ -654,54 +2047,52 @@ def get_gsheets_attendance(date):
     present_students = []
     absent_students = []
     
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-    c.execute("SELECT DISTINCT course FROM students")
-    courses = [row[0] for row in c.fetchall()]
-    conn.close()
-    
-    for course in courses:
+    # Only ask for tabs that exist; one unknown range fails the whole batch
+    titles = []
+    for course in get_roster().by_course:
         sheet_name = sanitize_sheet_name(course, for_google_sheets=True)
+        if sheet_name in titles:
+            continue
         try:
-            ws = None
-            for worksheet in sheet.worksheets():
-                if worksheet.title == sheet_name:
-                    ws = worksheet
-                    break
-            if not ws:
-                continue
-            
-            all_data = ws.get_all_values()
-            if len(all_data) < 1:
-                continue
-            
-            headers = all_data[0]
-            date_col = None
-            for i, header in enumerate(headers, 1):
-                if header == date_str:
-                    date_col = i
-                    break
-            if not date_col:
+            if gsheets.worksheet(sheet_name):
+                titles.append(sheet_name)
+        except Exception as e:
+            gsheets.invalidate(e)
+            logging.error(f"Error fetching Google Sheets attendance for {course} on {date_str}: {e}")
+    if not titles:
+        return [], []
+    
+    headers = batch_get_tabs(sheet, {title: [absolute_range_name(title, "1:1")] for title in titles}, date_str)
+    date_columns = {}
+    for title, (value_range,) in headers.items():
+        header = (value_range.get("values") or [[]])[0]
+        if date_str in header:
+            letter = "".join(ch for ch in rowcol_to_a1(1, header.index(date_str) + 1) if ch.isalpha())
+            date_columns[title] = letter
+    if not date_columns:
+        return [], []
+    
+    columns = batch_get_tabs(sheet, {title: [absolute_range_name(title, "A:C"), absolute_range_name(title, f"{letter}:{letter}")]
+                                     for title, letter in date_columns.items()}, date_str)
+    for title, (students, statuses) in columns.items():
+        # Both ranges start at row 1 and only trailing empty rows are trimmed, so rows line up
+        student_rows = students.get("values", [])[1:]
+        status_rows = statuses.get("values", [])[1:]
+        for row, status_row in zip(student_rows, status_rows):
+            if len(row) < 3:
                 continue
+            pin = str(row[0]).strip('"') if row[0] else ""
+            name = row[1] or "Unknown"
+            branch = row[2] or "Unknown"
+            status = status_row[0] if status_row else None
             
-            for row in all_data[1:]:
-                if len(row) < 3:
-                    continue
-                pin = str(row[0]).strip('"') if row[0] else ""
-                name = row[1] or "Unknown"
-                branch = row[2] or "Unknown"
-                status = row[date_col-1] if len(row) > date_col-1 else None
-                
-                if pin and status:
-                    if status == "Present":
-                        present_students.append((pin, name, branch))
-                    elif status == "Absent":
-                        absent_students.append((pin, name, branch))
-        
-        except Exception as e:
-            logging.error(f"Error fetching Google Sheets attendance for {course}: {e}")
-            continue
+            if pin and status:
+                if status == "Present":
+                    present_students.append((pin, name, branch))
+                elif status == "Absent":
+                    absent_students.append((pin, name, branch))
     
+    logging.info(f"get_gsheets_attendance for {date_str} read {len(titles)} tabs in two batches - Present: {len(present_students)}, Absent: {len(absent_students)}")
     return present_students, absent_students
 
 def get_dashboard_stats():
@@ -711,18 +2102,15 @@ def get_dashboard_stats():
     absent_today = 0
     missing_photos = 0
     
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM students")
     total_students = c.fetchone()[0]
     c.execute("SELECT COUNT(*) FROM students WHERE photo_path IS NULL OR photo_path NOT LIKE 'static/images/%'")
     missing_photos = c.fetchone()[0]
-    conn.close()
-    
-    present_students, absent_students = get_excel_attendance(today)
-    if present_students is not None and absent_students is not None:
-        present_today = len(present_students)
-        absent_today = len(absent_students)
+    c.execute("SELECT COALESCE(SUM(present), 0) FROM attendance_daily WHERE date = ?", (today.strftime("%Y-%m-%d"),))
+    present_today = c.fetchone()[0]
+    absent_today = total_students - present_today
     
     percentage = (present_today / total_students * 100) if total_students > 0 else 0
     return total_students, present_today, absent_today, round(percentage, 2), missing_photos
@@ -740,12 +2128,11 @@ def student_login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        conn = sqlite3.connect("database.db")
+        conn = get_db()
         c = conn.cursor()
         c.execute("SELECT username, role FROM users WHERE username = ? AND password = ? AND role = 'student'", 
                   (username, password))
         user_data = c.fetchone()
-        conn.close()
         if user_data:
             user = User(user_data[0], user_data[1])
             login_user(user)
@@ -758,12 +2145,11 @@ def trainer_login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        conn = sqlite3.connect("database.db")
+        conn = get_db()
         c = conn.cursor()
         c.execute("SELECT username, role FROM users WHERE username = ? AND password = ? AND role = 'trainer'", 
                   (username, password))
         user_data = c.fetchone()
-        conn.close()
         if user_data:
             user = User(user_data[0], user_data[1])
             login_user(user)
@@ -777,47 +2163,28 @@ def student_dashboard():
     if current_user.role != 'student':
         return redirect(url_for('trainer_dashboard'))
     
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT pin, name, branch, course, photo_path, resume_path FROM students WHERE pin = ?", (current_user.id,))
     student = c.fetchone()
-    conn.close()
-    
+
     if not student:
         return "Student data not found", 404
+
+    c.execute("""SELECT d.date, a.status FROM
+                 (SELECT DISTINCT a.date FROM attendance a JOIN students s ON s.pin = a.pin WHERE s.course = ?) d
+                 LEFT JOIN attendance a ON a.pin = ? AND a.date = d.date
+                 ORDER BY d.date DESC""", (student[3], student[0]))
+    history = c.fetchall()
     
-    wb = openpyxl.load_workbook(ATTENDANCE_SHEET_PATH) if os.path.exists(ATTENDANCE_SHEET_PATH) else openpyxl.Workbook()
-    if student[3] in wb.sheetnames:
-        ws = wb[student[3]]
-        date_cols = [(col, ws.cell(row=1, column=col).value) for col in range(4, ws.max_column + 1) if ws.cell(row=1, column=col).value]
-        total_days = len(date_cols)
-        
-        present_days = 0
-        absent_days = 0
-        recent_history = []
-        for col, date in date_cols:
-            for row in range(2, ws.max_row + 1):
-                if str(ws[f"A{row}"].value).strip('"') == student[0]:
-                    status = ws.cell(row=row, column=col).value
-                    if status == "Present":
-                        present_days += 1
-                    elif status == "Absent":
-                        absent_days += 1
-                    recent_history.append((date, status if status in ["Present", "Absent"] else "Not Marked"))
-                    break
-        
-        recent_history.sort(key=lambda x: datetime.strptime(x[0], "%d-%m-%Y"), reverse=True)
-        recent_history = recent_history[:5]
-        
-        percentage = (present_days / total_days * 100) if total_days > 0 else 0
-        low_attendance = percentage < 75
-    else:
-        total_days = 0
-        present_days = 0
-        absent_days = 0
-        recent_history = []
-        percentage = 0
-        low_attendance = False
+    total_days = len(history)
+    present_days = sum(1 for _, status in history if status == "Present")
+    absent_days = total_days - present_days
+    recent_history = [(datetime.strptime(date, "%Y-%m-%d").strftime("%d-%m-%Y"), status or "Absent")
+                      for date, status in history[:5]]
+    
+    percentage = (present_days / total_days * 100) if total_days > 0 else 0
+    low_attendance = total_days > 0 and percentage < 75
     
     return render_template('student_dashboard.html', student=student, percentage=round(percentage, 2), 
                            present_days=present_days, absent_days=absent_days, total_days=total_days,
@@ -847,11 +2214,10 @@ def upload_resume():
     os.makedirs("static/resumes", exist_ok=True)
     try:
         resume.save(resume_path)
-        conn = sqlite3.connect("database.db")
+        conn = get_db()
         c = conn.cursor()
         c.execute("UPDATE students SET resume_path = ? WHERE pin = ?", (resume_path, current_user.id))
         conn.commit()
-        conn.close()
         log_activity("Upload Resume", f"Student {current_user.id} uploaded a resume")
         flash("Resume uploaded successfully!", "success")
     except Exception as e:
@@ -872,7 +2238,7 @@ def submit_feedback():
             flash("Feedback cannot be empty.", "error")
             return redirect(url_for('student_dashboard'))
         date = datetime.now().strftime('%Y-%m-%d')
-        conn = sqlite3.connect("database.db")
+        conn = get_db()
         c = conn.cursor()
         c.execute("INSERT INTO feedback (pin, comment, date) VALUES (?, ?, ?)",
                   (current_user.id, comment, date))
@@ -884,8 +2250,6 @@ def submit_feedback():
     except Exception as e:
         flash(f"Error submitting feedback: {str(e)}", "error")
         logging.error(f"Error in submit_feedback: {str(e)}")
-    finally:
-        conn.close()
     return redirect(url_for('student_dashboard'))
 
 # Idea #3: Add Toggle for Reminders
@@ -908,10 +2272,10 @@ def review_feedback():
         flash("Only trainers can view feedback.", "error")
         return redirect(url_for('student_dashboard'))
     try:
-        conn = sqlite3.connect("database.db")
+        conn = get_db()
         c = conn.cursor()
-        logging.info(f"Connected to database: {os.path.abspath('database.db')}")
-        c.execute("SELECT pin, comment, date FROM feedback ORDER BY date DESC")
+        logging.info(f"Connected to database: {os.path.abspath(DATABASE_PATH)}")
+        c.execute(FEEDBACK_LIST_QUERY)
         feedbacks = c.fetchall()
         logging.info(f"Retrieved feedbacks before render: {feedbacks}")
         if not feedbacks:
@@ -922,8 +2286,6 @@ def review_feedback():
         flash(f"Error retrieving feedback: {str(e)}", "error")
         logging.error(f"Error in review_feedback: {str(e)}")
         feedbacks = []
-    finally:
-        conn.close()
     return render_template('trainer_dashboard.html', action='review_feedback', feedbacks=feedbacks)
 
 @app.route('/download_feedback_excel')
@@ -953,40 +2315,31 @@ def trainer_dashboard():
     reminders_enabled = config["reminders_enabled"]
     
     if action == 'search':
-        conn = sqlite3.connect("database.db")
-        c = conn.cursor()
         search_query = request.args.get('search', '').strip()
         search_field = request.args.get('search_field', 'pin')
         field_map = {'pin': 'pin', 'name': 'name', 'branch': 'branch', 'course': 'course'}
         column = field_map.get(search_field, 'pin')
+        page = max(request.args.get('page', 1, type=int), 1)
         
-        if search_query:
-            c.execute(f"SELECT pin, name, branch, course, photo_path FROM students WHERE {column} LIKE ? ORDER BY pin",
-                      (f'%{search_query}%',))
-        else:
-            c.execute("SELECT pin, name, branch, course, photo_path FROM students ORDER BY pin")
-        
-        students = c.fetchall()
-        conn.close()
+        students, has_next = search_students(search_query, column, page)
         return render_template('trainer_dashboard.html', action=action, students=students,
+                              page=page, has_next=has_next,
                               total_students=total_students, present_today=present_today, 
                               absent_today=absent_today, percentage_today=percentage_today, 
                               missing_photos=missing_photos, recent_activity=recent_activity,
                               default_date=default_date, reminders_enabled=reminders_enabled)
     
     elif action == 'student_resumes':
-        conn = sqlite3.connect("database.db")
+        conn = get_db()
         c = conn.cursor()
         pin_search = request.args.get('pin_search', '').strip()
         
         if pin_search:
-            c.execute("SELECT pin, name, branch, course, resume_path FROM students WHERE resume_path IS NOT NULL AND pin LIKE ? ORDER BY pin",
-                      (f'%{pin_search}%',))
+            c.execute(RESUME_SEARCH_QUERY, (f'%{pin_search}%',))
         else:
-            c.execute("SELECT pin, name, branch, course, resume_path FROM students WHERE resume_path IS NOT NULL ORDER BY pin")
+            c.execute(RESUME_LIST_QUERY)
         
         students_with_resumes = c.fetchall()
-        conn.close()
         return render_template('trainer_dashboard.html', action=action, students_with_resumes=students_with_resumes,
                               total_students=total_students, present_today=present_today, 
                               absent_today=absent_today, percentage_today=percentage_today, 
@@ -1014,23 +2367,14 @@ def trainer_dashboard():
             present_students, absent_students = [], []
             
         
-        conn = sqlite3.connect("database.db")
+        conn = get_db()
         c = conn.cursor()
-        query = "SELECT COUNT(*) FROM students"
-        params = []
-        if selected_branch != 'all' and selected_course != 'all':
-            query += " WHERE UPPER(branch) = UPPER(?) AND UPPER(course) = UPPER(?)"
-            params = [selected_branch, selected_course]
-        elif selected_branch != 'all':
-            query += " WHERE UPPER(branch) = UPPER(?)"
-            params = [selected_branch]
-        elif selected_course != 'all':
-            query += " WHERE UPPER(course) = UPPER(?)"
-            params = [selected_course]
+        where, params = student_filter(selected_branch if selected_branch != 'all' else None,
+                                       selected_course if selected_course != 'all' else None)
+        query = f"SELECT COUNT(*) FROM students{where}"
         c.execute(query, params)
         total_filtered_students = c.fetchone()[0]
         logging.info(f"Query: {query} with params {params} returned total_filtered_students: {total_filtered_students}")
-        conn.close()
         
         present_count = len(present_students)
         absent_count = len(absent_students)
@@ -1082,14 +2426,44 @@ def trainer_dashboard():
         response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
         return response
     
+    excel_last_flushed, excel_pending = get_excel_export_status()
+    gsheets_last_synced, gsheets_pending, gsheets_lag, gsheets_failed = get_gsheets_sync_status()
+    last_reminder_check = get_last_job_run("check_absent_students")
+    upload_job = get_upload_job(request.args.get('job_id', type=int)) if action == 'bulk_upload' and request.args.get('job_id') else None
     response = make_response(render_template('trainer_dashboard.html', action=action,
                           total_students=total_students, present_today=present_today, 
                           absent_today=absent_today, percentage_today=percentage_today, 
                           missing_photos=missing_photos, recent_activity=recent_activity,
-                          default_date=default_date, reminders_enabled=reminders_enabled))
+                          default_date=default_date, reminders_enabled=reminders_enabled,
+                          excel_last_flushed=excel_last_flushed, excel_pending=excel_pending,
+                          workbook_cache_stats=get_workbook_cache_stats(),
+                          gsheets_last_synced=gsheets_last_synced, gsheets_pending=gsheets_pending,
+                          gsheets_lag=gsheets_lag, gsheets_failed=gsheets_failed, last_reminder_check=last_reminder_check,
+                          upload_job=upload_job))
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
     return response
 
+@app.route('/attendance_analytics')
+@login_required
+def attendance_analytics():
+    if current_user.role != 'trainer':
+        return jsonify({"status": "error", "message": "Unauthorized"}), 403
+    course = request.args.get('course')
+    if not course:
+        return jsonify({"status": "error", "message": "Missing course"}), 400
+    # Only courses on the roster get matrix files
+    if course not in get_roster().by_course:
+        return jsonify({"status": "error", "message": f"Unknown course: {course}"}), 404
+    try:
+        return jsonify({"status": "success", **get_course_analytics(course)})
+    except Exception as e:
+        logging.error(f"Failed to compute analytics for {course}: {e}")
+        return jsonify({"status": "error", "message": f"Error computing analytics: {str(e)}"}), 500
+
+def gsheets_sync_lag():
+    _, pending, lag, _ = get_gsheets_sync_status()
+    return {"gsheets_pending": pending, "gsheets_lag_seconds": lag}
+
 @app.route('/scan', methods=['POST'])
 @login_required
 def scan():
@@ -1098,36 +2472,57 @@ def scan():
     
     data = request.get_json()
     scanned_pins = data.get('scanned_pins', [])
+    session_id = data.get('session_id')
+    seq = data.get('seq')
+    if seq is not None:
+        try:
+            seq = int(seq)
+        except (TypeError, ValueError):
+            logging.warning(f"Rejecting scan batch with invalid seq {seq!r}")
+            return jsonify({"status": "error", "message": "seq must be an integer"}), 400
     
     if scanned_pins:
-        logging.info(f"Received scanned pins: {scanned_pins}")
+        logging.info(f"Received scanned pins: {scanned_pins} (session: {session_id}, seq: {seq})")
+        batch_claimed = False
+        if session_id is not None and seq is not None:
+            if not claim_scan_batch(session_id, seq):
+                logging.info(f"Ignoring replayed scan batch {seq} for session {session_id}")
+                return jsonify({"status": "success", "scanned": [], "duplicate": True})
+            batch_claimed = True
         try:
-            valid_pins = []
-            conn = sqlite3.connect("database.db")
-            c = conn.cursor()
-            for pin in scanned_pins:
-                c.execute("SELECT pin FROM students WHERE pin = ?", (str(pin).strip('"'),))
-                if c.fetchone():
-                    valid_pins.append(str(pin).strip('"'))
-                else:
+            today = datetime.now().strftime("%Y-%m-%d")
+            pins = list(dict.fromkeys(str(pin).strip('"') for pin in scanned_pins))
+            roster = get_roster()
+            valid_pins = [pin for pin in pins if pin in roster.students]
+            for pin in pins:
+                if pin not in roster.students:
                     logging.warning(f"PIN {pin} not found in database, skipping.")
-            conn.close()
+            c = get_db().cursor()
+            c.execute(f"SELECT pin FROM attendance WHERE date = ? AND status = 'Present' AND pin IN ({', '.join('?' for _ in valid_pins)})",
+                      [today] + valid_pins)
+            already_present = {row[0] for row in c.fetchall()}
+            new_pins = [pin for pin in valid_pins if pin not in already_present]
 
             if not valid_pins:
+                if batch_claimed:
+                    release_scan_batch(session_id, seq)
                 return jsonify({"status": "error", "message": "No valid pins found in database"}), 400
+            if not new_pins:
+                logging.info(f"All scanned PINs already marked present for {today}")
+                return jsonify({"status": "success", "scanned": valid_pins, "excel_queued": False, "gsheets_queued": False,
+                                **gsheets_sync_lag()})
 
-            excel_updated = update_excel(valid_pins)
-            if not excel_updated:
-                logging.warning("Excel update failed, but proceeding with Google Sheets update.")
+            gsheets_queued = mark_attendance(new_pins, today, "Present", "scan")
             
-            gsheets_updated = update_google_sheets(valid_pins)
-            
-            for pin in valid_pins:
+            for pin in new_pins:
                 log_activity("Scan QR", f"Scanned PIN {pin}")
-            logging.info(f"Processed valid PINs: {valid_pins}")
-            return jsonify({"status": "success", "scanned": valid_pins, "excel_updated": excel_updated, "gsheets_updated": gsheets_updated})
+            logging.info(f"Processed valid PINs: {new_pins}")
+            return jsonify({"status": "success", "scanned": valid_pins, "excel_queued": True, "gsheets_queued": gsheets_queued,
+                            **gsheets_sync_lag()})
         except Exception as e:
             logging.error(f"Failed to process scan: {e}")
+            if batch_claimed:
+                release_scan_batch(session_id, seq)
             return jsonify({"status": "error", "message": f"Error processing scan: {str(e)}"}), 500
     return jsonify({"status": "error", "message": "No QR codes scanned"})
 
@@ -1157,7 +2552,7 @@ def add_student():
         logging.error(f"Failed to save photo: {e}")
         return jsonify({"status": "error", "message": f"Failed to save photo: {e}"}), 500
     
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     c.execute('PRAGMA table_info(students)')
     columns = [column[1] for column in c.fetchall()]
@@ -1172,23 +2567,10 @@ def add_student():
     c.execute(f"INSERT OR REPLACE INTO students ({', '.join(insert_columns)}) VALUES ({', '.join(['?' for _ in insert_columns])})", insert_values)
     c.execute("INSERT OR IGNORE INTO users VALUES (?, ?, 'student')", (pin, "LOKESH"))
     conn.commit()
-    conn.close()
-    
-    wb = openpyxl.load_workbook(EXCEL_PATH) if os.path.exists(EXCEL_PATH) else openpyxl.Workbook()
-    sheet_name = course
-    if sheet_name not in wb.sheetnames:
-        ws = wb.create_sheet(sheet_name)
-        ws["A1"] = "PIN (Roll.No)"
-        ws["B1"] = "NAME"
-        ws["C1"] = "BRANCH"
-    ws = wb[sheet_name]
-    sheet_pin_map = {str(ws[f"A{row}"].value).strip('"'): row for row in range(2, ws.max_row + 1) if ws[f"A{row}"].value}
-    if pin not in sheet_pin_map:
-        next_row = ws.max_row + 1
-        ws[f"A{next_row}"] = pin
-        ws[f"B{next_row}"] = name
-        ws[f"C{next_row}"] = branch
-    wb.save(EXCEL_PATH)
+    
+    with cached_workbook(EXCEL_PATH) as wb:
+        get_sheet_index(wb, course).add_student(pin, name, branch)
+        save_cached_workbook(EXCEL_PATH, wb)
     
     log_activity("Add Student", f"Added student {name} (PIN: {pin})")
     return redirect(url_for('trainer_dashboard'))
@@ -1203,96 +2585,48 @@ def bulk_upload_students():
     if 'file' not in request.files:
         flash("No file uploaded")
         logging.warning("No file uploaded")
-        return redirect(url_for('trainer_dashboard', action='add'))
+        return redirect(url_for('trainer_dashboard', action='bulk_upload'))
     
     file = request.files['file']
     if file.filename == '':
         flash("No file selected")
         logging.warning("No file selected")
-        return redirect(url_for('trainer_dashboard', action='add'))
+        return redirect(url_for('trainer_dashboard', action='bulk_upload'))
     
     if not (file.filename.endswith('.csv') or file.filename.endswith('.xlsx')):
         flash("Invalid file format. Please upload a CSV or Excel file.")
         logging.warning("Invalid file format")
-        return redirect(url_for('trainer_dashboard', action='add'))
+        return redirect(url_for('trainer_dashboard', action='bulk_upload'))
     
     try:
-        logging.info(f"Processing file: {file.filename}")
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        else:
-            df = pd.read_excel(file)
-        
-        required_columns = ["PIN (Roll.No)", "NAME", "BRANCH", "COURSE"]
-        if not all(col in df.columns for col in required_columns):
-            missing_cols = [col for col in required_columns if col not in df.columns]
-            flash(f"Sheet is missing required columns: {', '.join(missing_cols)}")
-            logging.warning(f"Sheet missing columns: {missing_cols}")
-            return redirect(url_for('trainer_dashboard', action='add'))
-        
-        conn = sqlite3.connect("database.db")
-        c = conn.cursor()
-        
-        c.execute('PRAGMA table_info(students)')
-        table_columns = [column[1] for column in c.fetchall()]
-        insert_columns = ['pin', 'name', 'branch', 'course', 'photo_path']
-        insert_values = [None]
-        if 'email' in table_columns:
-            insert_columns.append('email')
-            insert_values.append(None)
-        if 'resume_path' in table_columns:
-            insert_columns.append('resume_path')
-            insert_values.append(None)
-        
-        insert_sql = f"INSERT OR REPLACE INTO students ({', '.join(insert_columns)}) VALUES ({', '.join(['?' for _ in insert_columns])})"
-        
-        added_count = 0
-        
-        wb = openpyxl.load_workbook(EXCEL_PATH) if os.path.exists(EXCEL_PATH) else openpyxl.Workbook()
-        
-        for index, row in df.iterrows():
-            logging.info(f"Processing row {index + 2}: {row.tolist()}")
-            pin = str(row["PIN (Roll.No)"]).strip('"') if pd.notna(row["PIN (Roll.No)"]) else None
-            name = str(row["NAME"]) if pd.notna(row["NAME"]) else None
-            branch = str(row["BRANCH"]) if pd.notna(row["BRANCH"]) else None
-            course = str(row["COURSE"]) if pd.notna(row["COURSE"]) else "Default"
-            
-            if not pin or not name or not branch or not course:
-                logging.warning(f"Skipping row {index + 2} due to missing data: PIN={pin}, Name={name}, Branch={branch}, Course={course}")
-                continue
-            
-            c.execute(insert_sql, [pin, name, branch, course] + insert_values)
-            c.execute("INSERT OR IGNORE INTO users VALUES (?, ?, 'student')", (pin, "LOKESH"))
-            
-            sheet_name_to_use = course
-            if sheet_name_to_use not in wb.sheetnames:
-                ws = wb.create_sheet(sheet_name_to_use)
-                ws["A1"] = "PIN (Roll.No)"
-                ws["B1"] = "NAME"
-                ws["C1"] = "BRANCH"
-            ws = wb[sheet_name_to_use]
-            sheet_pin_map = {str(ws[f"A{row}"].value).strip('"'): row for row in range(2, ws.max_row + 1) if ws[f"A{row}"].value}
-            if pin not in sheet_pin_map:
-                next_row = ws.max_row + 1
-                ws[f"A{next_row}"] = pin
-                ws[f"B{next_row}"] = name
-                ws[f"C{next_row}"] = branch
-                added_count += 1
-        
-        wb.save(EXCEL_PATH)
-        conn.commit()
-        conn.close()
-        
-        if added_count > 0:
-            log_activity("Bulk Upload", f"Added {added_count} students via bulk upload")
-            flash(f"Successfully added {added_count} students")
-        else:
-            flash("No students were added. Check the file format or data.")
+        job_id = queue_upload_job(file, current_user.id)
     except Exception as e:
-        flash(f"Error processing file: {str(e)}")
+        flash(f"Error saving file: {str(e)}")
         logging.error(f"Error in bulk upload: {e}")
+        return redirect(url_for('trainer_dashboard', action='bulk_upload'))
     
-    return redirect(url_for('trainer_dashboard', action='add'))
+    logging.info(f"Queued bulk upload {job_id} of {file.filename}")
+    return redirect(url_for('trainer_dashboard', action='bulk_upload', job_id=job_id))
+
+@app.route('/bulk_upload_jobs/<int:job_id>')
+@login_required
+def bulk_upload_job_status(job_id):
+    if current_user.role != 'trainer':
+        return jsonify({"status": "error", "message": "Unauthorized"}), 403
+    job = get_upload_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Upload job not found"}), 404
+    return jsonify({"status": "success", "job": job})
+
+@app.route('/bulk_upload_jobs/<int:job_id>/errors')
+@login_required
+def download_bulk_upload_errors(job_id):
+    if current_user.role != 'trainer':
+        return jsonify({"status": "error", "message": "Unauthorized"}), 403
+    c = get_db().cursor()
+    c.execute("SELECT row, pin, name, branch, course, reason FROM upload_job_errors WHERE job_id = ? ORDER BY row", (job_id,))
+    return stream_xlsx(f"Upload_{job_id}_errors", ["Row", "PIN (Roll.No)", "NAME", "BRANCH", "COURSE", "Reason"], c,
+                       f"bulk_upload_{job_id}_errors.xlsx")
 
 # Idea #5: Attendance Correction Route
 @app.route('/correct_attendance', methods=['POST'])
@@ -1313,12 +2647,37 @@ def correct_attendance():
     if new_status not in ["Present", "Absent"]:
         return jsonify({"status": "error", "message": "Invalid status"}), 400
     
-    if update_attendance(pin, date, new_status, course):
+    if update_attendance(pin, date, new_status):
         log_activity("Correct Attendance", f"Changed attendance for PIN {pin} on {date} to {new_status} in course {course}")
         return jsonify({"status": "success", "message": f"Attendance updated to {new_status}"})
     else:
         return jsonify({"status": "error", "message": "Failed to update attendance"}), 500
 
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def stream_xlsx(sheet_title, headers, rows, filename):
+    """Write rows with openpyxl's write-only mode to a temp file and stream it back in chunks."""
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_title)
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+
+    def generate():
+        with output:
+            while True:
+                chunk = output.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+
+    return Response(generate(), mimetype=XLSX_MIMETYPE,
+                    headers={"Content-Disposition": f"attachment;filename={filename}"})
+
 @app.route('/download_excel_today')
 @login_required
 def download_excel_today():
@@ -1332,37 +2691,10 @@ def download_excel_today():
     if present_students is None or absent_students is None:
         return "Error generating Excel file", 500
     
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Attendance_{date_str}"
-    
-    headers = ["PIN", "Name", "Branch", "Course", "Status"]
-    for col, header in enumerate(headers, 1):
-        ws.cell(row=1, column=col, value=header)
-    
-    row = 2
-    for student in present_students:
-        ws.cell(row=row, column=1, value=student[0])
-        ws.cell(row=row, column=2, value=student[1])
-        ws.cell(row=row, column=3, value=student[2])
-        ws.cell(row=row, column=4, value=student[3])
-        ws.cell(row=row, column=5, value="Present")
-        row += 1
-    for student in absent_students:
-        ws.cell(row=row, column=1, value=student[0])
-        ws.cell(row=row, column=2, value=student[1])
-        ws.cell(row=row, column=3, value=student[2])
-        ws.cell(row=row, column=4, value=student[3])
-        ws.cell(row=row, column=5, value="Absent")
-        row += 1
-    
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
+    rows = [(*student, "Present") for student in present_students] + [(*student, "Absent") for student in absent_students]
     log_activity("Download Excel", f"Downloaded Excel for {date_str}")
-    return Response(output.getvalue(), mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    headers={"Content-Disposition": f"attachment;filename=excel_attendance_{date_str}.xlsx"})
+    return stream_xlsx(f"Attendance_{date_str}", ["PIN", "Name", "Branch", "Course", "Status"], rows,
+                       f"excel_attendance_{date_str}.xlsx")
 
 @app.route('/download_gsheets_today')
 @login_required
@@ -1377,35 +2709,10 @@ def download_gsheets_today():
     if present_students is None or absent_students is None:
         return "Error generating Excel file", 500
     
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Attendance_{date_str}"
-    
-    headers = ["PIN", "Name", "Branch", "Status"]
-    for col, header in enumerate(headers, 1):
-        ws.cell(row=1, column=col, value=header)
-    
-    row = 2
-    for student in present_students:
-        ws.cell(row=row, column=1, value=student[0])
-        ws.cell(row=row, column=2, value=student[1])
-        ws.cell(row=row, column=3, value=student[2])
-        ws.cell(row=row, column=4, value="Present")
-        row += 1
-    for student in absent_students:
-        ws.cell(row=row, column=1, value=student[0])
-        ws.cell(row=row, column=2, value=student[1])
-        ws.cell(row=row, column=3, value=student[2])
-        ws.cell(row=row, column=4, value="Absent")
-        row += 1
-    
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
+    rows = [(*student, "Present") for student in present_students] + [(*student, "Absent") for student in absent_students]
     log_activity("Download GSheets", f"Downloaded GSheets for {date_str}")
-    return Response(output.getvalue(), mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    headers={"Content-Disposition": f"attachment;filename=gsheets_attendance_{date_str}.xlsx"})
+    return stream_xlsx(f"Attendance_{date_str}", ["PIN", "Name", "Branch", "Status"], rows,
+                       f"gsheets_attendance_{date_str}.xlsx")
 
 @app.route('/download_excel_presentees')
 @login_required
@@ -1426,30 +2733,10 @@ def download_excel_presentees():
     if present_students is None:
         return "Error generating Excel file", 500
     
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Presentees_{date_str}"
-    
-    headers = ["PIN", "Name", "Branch", "Course", "Status"]
-    for col, header in enumerate(headers, 1):
-        ws.cell(row=1, column=col, value=header)
-    
-    row = 2
-    for student in present_students:
-        ws.cell(row=row, column=1, value=student[0])
-        ws.cell(row=row, column=2, value=student[1])
-        ws.cell(row=row, column=3, value=student[2])
-        ws.cell(row=row, column=4, value=student[3])
-        ws.cell(row=row, column=5, value="Present")
-        row += 1
-    
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
+    rows = [(*student, "Present") for student in present_students]
     log_activity("Download Excel Presentees", f"Downloaded Excel for presentees on {date_str} (Branch: {branch}, Course: {course})")
-    return Response(output.getvalue(), mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    headers={"Content-Disposition": f"attachment;filename=presentees_{date_str}.xlsx"})
+    return stream_xlsx(f"Presentees_{date_str}", ["PIN", "Name", "Branch", "Course", "Status"], rows,
+                       f"presentees_{date_str}.xlsx")
 
 @app.route('/download_excel_absentees')
 @login_required
@@ -1470,36 +2757,17 @@ def download_excel_absentees():
     if absent_students is None:
         return "Error generating Excel file", 500
     
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Absentees_{date_str}"
-    
-    headers = ["PIN", "Name", "Branch", "Course", "Status"]
-    for col, header in enumerate(headers, 1):
-        ws.cell(row=1, column=col, value=header)
-    
-    row = 2
-    for student in absent_students:
-        ws.cell(row=row, column=1, value=student[0])
-        ws.cell(row=row, column=2, value=student[1])
-        ws.cell(row=row, column=3, value=student[2])
-        ws.cell(row=row, column=4, value=student[3])
-        ws.cell(row=row, column=5, value="Absent")
-        row += 1
-    
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
+    rows = [(*student, "Absent") for student in absent_students]
     log_activity("Download Excel Absentees", f"Downloaded Excel for absentees on {date_str} (Branch: {branch}, Course: {course})")
-    return Response(output.getvalue(), mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    headers={"Content-Disposition": f"attachment;filename=absentees_{date_str}.xlsx"})
+    return stream_xlsx(f"Absentees_{date_str}", ["PIN", "Name", "Branch", "Course", "Status"], rows,
+                       f"absentees_{date_str}.xlsx")
 
 @app.route('/student/generate_qr', methods=['GET'])
 @login_required
 def generate_qr_student():
     if current_user.role != 'student':
         return "Access denied: Only students can generate QR codes.", 403
+    import qrcode
     
     # Get student ID and current date
     student_id = current_user.id  # Student’s unique ID
@@ -1542,8 +2810,49 @@ def serve_video(filename):
 def serve_sound(filename):
     return send_from_directory('static/sounds', filename)
 
+def measure_boot(cwd=None):
+    """Import app.py in a fresh interpreter with -X importtime, in cwd (default: next to app.py).
+
+    Returns (returncode, stderr, [(cumulative_us, self_us, depth, module)]) in import order.
+    """
+    env = dict(os.environ, SCHEDULER_ENABLED="0",
+               PYTHONPATH=os.pathsep.join(filter(None, [app.root_path, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=cwd or app.root_path,
+                            env=env, capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        depth = (len(module) - len(module.lstrip()) - 1) // 2
+        imports.append((int(cumulative_us), int(self_us), depth, module.strip()))
+    return result.returncode, result.stderr, imports
+
+def boot_ms(imports):
+    """Cumulative import time of app itself, in ms, from measure_boot()'s import list."""
+    return next(cumulative for cumulative, _, _, module in imports if module == "app") / 1000
+
+@app.cli.command("boot-report")
+def boot_report_command():
+    """List the slowest imports at boot and exit non-zero if app.py is over BOOT_BUDGET_MS."""
+    returncode, stderr, imports = measure_boot()
+    if returncode != 0:
+        print(stderr[-2000:])
+        print("Importing app.py failed")
+        sys.exit(1)
+    total_ms = boot_ms(imports)
+    print("Slowest top-level imports (cumulative ms, self ms):")
+    for cumulative, self_us, _, module in sorted((i for i in imports if i[2] == 0), reverse=True)[:15]:
+        print(f"  {cumulative / 1000:9.1f} {self_us / 1000:9.1f}  {module}")
+    print("Slowest single modules (self ms):")
+    for cumulative, self_us, _, module in sorted(imports, key=lambda i: i[1], reverse=True)[:10]:
+        print(f"  {self_us / 1000:9.1f}  {module}")
+    print(f"import app: {total_ms:.0f} ms (budget {BOOT_BUDGET_MS} ms)")
+    sys.exit(1 if total_ms > BOOT_BUDGET_MS else 0)
+
+logging.info(f"app.py loaded in {(time.perf_counter() - BOOT_STARTED) * 1000:.0f} ms")
+
 if __name__ == "__main__":
-    init_db()
     os.makedirs("static/images", exist_ok=True)
     os.makedirs("static/resumes", exist_ok=True)
     os.makedirs("static/qr_codes", exist_ok=True)
@@ -0,0 +1,162 @@
+"""Benchmark the Google Sheets code paths of app.py against the in-process fake in fake_gsheets.py.
+
+app.py is imported with its database and relative paths pointed at a scratch directory. The
+benchmark seeds --courses x --students students with --days days of history in the fake
+spreadsheet, then measures API calls and wall time for:
+
+  scan         mark_attendance for one scan batch (what /scan waits for)
+  scan-sync    that batch pushed to Sheets by sync_gsheets_outbox (replaces update_google_sheets)
+  correction   update_attendance plus the sync that pushes it
+  read-cold    get_gsheets_attendance with a fresh client (authorize, open, list tabs)
+  read         get_gsheets_attendance with the client and tab list cached (today_gsheets page)
+
+Quota errors injected with --quota-every are retried immediately rather than after the backoff,
+and counted in the "retries" column.
+
+usage: python benchmark_gsheets.py [--courses 5] [--students 60] [--days 30] [--rounds 20]
+                                   [--scan-size 15] [--latency 0.05] [--quota-every 0]
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from fake_gsheets import FakeGoogleSheets
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAX_RETRIES = 20
+
+
+def load_app(workdir):
+    """Import app.py with database.db and the workbook paths living in workdir."""
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    import db
+    db.DATABASE_PATH = os.path.join(workdir, "database.db")
+    import app
+    return app
+
+
+def seed(app, fake, courses, students, days):
+    """Insert the students and give every course tab `days` days of attendance in the fake spreadsheet."""
+    rng = random.Random(1)
+    today = datetime.now()
+    dates = [(today - timedelta(days=i)).strftime("%d-%m-%Y") for i in range(days, 0, -1)]
+    spreadsheet = fake.spreadsheet(app.GOOGLE_SHEET_NAME)
+    rows = []
+    for course_no in range(1, courses + 1):
+        course = f"BENCH&COURSE{course_no}"
+        members = [(f"{course_no:02d}BENCH{student_no:04d}", f"Student {course_no}-{student_no}", rng.choice(["CSE", "ECE", "EEE"]), course)
+                   for student_no in range(1, students + 1)]
+        rows.extend(members)
+        grid = [["PIN (Roll.No)", "NAME", "BRANCH"] + dates]
+        grid += [[pin, name, branch] + [rng.choice(["Present", "Present", "Absent"]) for _ in dates] for pin, name, branch, _ in members]
+        spreadsheet.load(app.sanitize_sheet_name(course, for_google_sheets=True), grid)
+
+    conn = app.get_db()
+    conn.executemany("INSERT OR REPLACE INTO students (pin, name, branch, course) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    return [pin for pin, _, _, _ in rows]
+
+
+def drain(app):
+    """Sync until the outbox is empty, making failed rows due again at once; returns the retries needed."""
+    conn = app.get_db()
+    retries = 0
+    while True:
+        app.sync_gsheets_outbox()
+        if not conn.execute("SELECT COUNT(*) FROM gsheets_outbox").fetchone()[0]:
+            return retries
+        retries += 1
+        if retries > MAX_RETRIES:
+            raise RuntimeError("Google Sheets outbox did not drain")
+        # The background worker may hold a lease on rows it is pushing; wait for it before resetting them
+        with app.gsheets_sync_lock:
+            conn.execute("UPDATE gsheets_outbox SET next_attempt_at = '', attempts = 0")
+            conn.commit()
+
+
+class Results:
+    def __init__(self):
+        self.rows = []
+
+    def measure(self, name, fake, fn, rounds):
+        times = []
+        retries = 0
+        fake.reset_calls()
+        for i in range(rounds):
+            start = time.perf_counter()
+            retries += fn(i) or 0
+            times.append((time.perf_counter() - start) * 1000)
+        calls = Counter(fake.calls)
+        self.rows.append((name, rounds, fake.api_calls() / rounds, statistics.mean(times),
+                          sorted(times)[int(len(times) * 0.95) - 1 if len(times) > 1 else 0], retries, calls))
+
+    def print(self):
+        print(f"{'scenario':<12} {'ops':>5} {'calls/op':>9} {'mean ms':>9} {'p95 ms':>9} {'retries':>8}  calls by method")
+        for name, rounds, calls_per_op, mean, p95, retries, calls in self.rows:
+            by_method = ", ".join(f"{method}={count}" for method, count in sorted(calls.items()))
+            print(f"{name:<12} {rounds:>5} {calls_per_op:>9.1f} {mean:>9.1f} {p95:>9.1f} {retries:>8}  {by_method}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--courses", type=int, default=5)
+    parser.add_argument("--students", type=int, default=60, help="students per course")
+    parser.add_argument("--days", type=int, default=30, help="days of history already in each tab")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--scan-size", type=int, default=15, help="PINs per scan batch, spread over all courses")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake API call")
+    parser.add_argument("--quota-every", type=int, default=0, help="fail every Nth API call with a 429")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="gsheets-bench-")
+    logging.disable(logging.WARNING)
+    app = load_app(workdir)
+    fake = FakeGoogleSheets(latency=args.latency, quota_every=args.quota_every)
+    pins = seed(app, fake, args.courses, args.students, args.days)
+    rng = random.Random(2)
+    today = datetime.now().strftime("%Y-%m-%d")
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    today_ddmmyyyy = datetime.now().strftime("%d-%m-%Y")
+    results = Results()
+
+    print(f"{args.courses} courses x {args.students} students, {args.days} days of history, "
+          f"{args.latency * 1000:.0f} ms per call, quota error every {args.quota_every or 'never'} calls (scratch dir {workdir})")
+    def read(i):
+        app.get_gsheets_attendance(datetime.now() - timedelta(days=1 + i % args.days))
+
+    def scan(i):
+        # A date of its own, so scan-sync still has cells to write for today
+        app.mark_attendance(batches[i], tomorrow, "Present", "scan")
+
+    def scan_sync(i):
+        app.mark_attendance(batches[i], today, "Present", "scan")
+        return drain(app)
+
+    def correction(i):
+        app.update_attendance(rng.choice(pins), today_ddmmyyyy, rng.choice(["Present", "Absent"]))
+        return drain(app)
+
+    batches = [rng.sample(pins, min(args.scan_size, len(pins))) for _ in range(args.rounds)]
+    with fake.patch(app):
+        app.gsheets = app.GSheetsClient()
+        results.measure("read-cold", fake, read, 1)
+        results.measure("read", fake, read, args.rounds)
+        # Holding the sync lock keeps the background worker off the API while the local commit is timed
+        with app.gsheets_sync_lock:
+            results.measure("scan", fake, scan, args.rounds)
+        drain(app)
+        results.measure("scan-sync", fake, scan_sync, args.rounds)
+        results.measure("correction", fake, correction, args.rounds)
+    results.print()
+
+
+if __name__ == "__main__":
+    main()
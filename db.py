@@ -0,0 +1,36 @@
+import os
+import sqlite3
+import threading
+
+DATABASE_PATH = "database.db"
+BUSY_TIMEOUT = 30  # seconds to wait for a write lock before raising "database is locked"
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+
+def get_db():
+    """Return this thread's connection to DATABASE_PATH, opening it on first use.
+
+    Connections are reused for the life of the thread, so callers must not close them. Commit
+    what you write; release_db() rolls back anything left uncommitted.
+    """
+    conn = getattr(_local, "conn", None)
+    # A connection inherited across fork (gunicorn --preload) must not be shared with the parent
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(DATABASE_PATH, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT * 1000}")
+        # INSERT OR REPLACE on students must fire the delete trigger that keeps students_fts in sync
+        conn.execute("PRAGMA recursive_triggers=ON")
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def release_db():
+    """Roll back any transaction left open on this thread's connection, keeping it for reuse."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and conn.in_transaction:
+        conn.rollback()
@@ -0,0 +1,271 @@
+"""In-process stand-in for the part of gspread that app.py uses, for measuring the Sheets code paths
+without credentials.json or network access.
+
+Every call that would be an HTTP request is counted in FakeGoogleSheets.calls, sleeps for the
+configured latency and can be made to fail with a 429 quota error. Values are kept as lists of
+strings, trimmed the way the API trims them, and writes outside a worksheet's grid are rejected
+like the real API rejects them.
+
+    fake = FakeGoogleSheets(latency=0.05, quota_every=20)
+    with fake.patch(app):
+        app.get_gsheets_attendance(datetime.now())
+    print(fake.calls)
+"""
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import gspread
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+RANGE_RE = re.compile(r"^(?:'((?:[^']|'')*)'|([^!']+?))(?:!(.+))?$")
+
+
+class FakeResponse:
+    """Just enough of requests.Response for gspread.exceptions.APIError."""
+
+    def __init__(self, code, message, status):
+        self.status_code = code
+        self.error = {"code": code, "message": message, "status": status}
+
+    def json(self):
+        return {"error": self.error}
+
+
+def api_error(code, message, status="INVALID_ARGUMENT"):
+    return gspread.exceptions.APIError(FakeResponse(code, message, status))
+
+
+class FakeGoogleSheets:
+    """Shared state for one fake Google account: spreadsheets, call counters and failure injection."""
+
+    def __init__(self, latency=0.0, quota_every=0):
+        self.latency = latency
+        self.quota_every = quota_every
+        self.calls = Counter()
+        self.spreadsheets = {}
+        self.lock = threading.Lock()
+
+    def request(self, method):
+        """Account for one API request: count it, wait out the latency, maybe fail it on quota."""
+        with self.lock:
+            self.calls[method] += 1
+            total = sum(self.calls.values())
+        if self.latency:
+            time.sleep(self.latency)
+        if self.quota_every and total % self.quota_every == 0:
+            self.calls["quota_errors"] += 1
+            raise api_error(429, "Quota exceeded for quota metric 'Write requests' (simulated)", "RESOURCE_EXHAUSTED")
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls.clear()
+
+    def api_calls(self):
+        return sum(count for method, count in self.calls.items() if method != "quota_errors")
+
+    def spreadsheet(self, name):
+        """Return (creating if needed) the spreadsheet called name, without counting a request."""
+        if name not in self.spreadsheets:
+            self.spreadsheets[name] = FakeSpreadsheet(self, name)
+        return self.spreadsheets[name]
+
+    def authorize(self, credentials):
+        self.request("authorize")
+        return FakeClient(self)
+
+    @contextmanager
+    def patch(self, module, credentials_path=None):
+        """Point gspread.authorize and ServiceAccountCredentials at this fake for the duration.
+
+        module is app.py, which imports both on first use; its CREDENTIALS_PATH is pointed at a file
+        that exists.
+        """
+        from oauth2client import service_account
+        fake = self
+        saved = (gspread.authorize, service_account.ServiceAccountCredentials, module.CREDENTIALS_PATH)
+
+        class Credentials:
+            access_token_expired = False
+
+            @classmethod
+            def from_json_keyfile_name(cls, filename, scope):
+                return cls()
+
+        gspread.authorize = fake.authorize
+        service_account.ServiceAccountCredentials = Credentials
+        # initialize_gsheets only checks that the key file exists
+        module.CREDENTIALS_PATH = credentials_path or __file__
+        try:
+            yield self
+        finally:
+            gspread.authorize, service_account.ServiceAccountCredentials, module.CREDENTIALS_PATH = saved
+
+
+class FakeClient:
+    def __init__(self, fake):
+        self.fake = fake
+
+    def open(self, title):
+        self.fake.request("open")
+        return self.fake.spreadsheet(title)
+
+
+class FakeSpreadsheet:
+    def __init__(self, fake, title):
+        self.fake = fake
+        self.title = title
+        self.tabs = {}
+        self.next_id = 1
+
+    def load(self, title, rows, row_count=None, col_count=20):
+        """Create or replace a tab holding rows, without counting a request (for seeding benchmarks)."""
+        ws = FakeWorksheet(self, title, self.next_id, row_count or len(rows) + 10, max(col_count, *(len(row) for row in rows or [[]])))
+        self.next_id += 1
+        ws.cells = [[str(value) for value in row] for row in rows]
+        self.tabs[title] = ws
+        return ws
+
+    def tab(self, range_name):
+        match = RANGE_RE.match(range_name)
+        title = match.group(1).replace("''", "'") if match.group(1) is not None else match.group(2)
+        if title not in self.tabs:
+            raise api_error(400, f"Unable to parse range: {range_name}")
+        return self.tabs[title], match.group(3)
+
+    def worksheets(self):
+        self.fake.request("worksheets")
+        return list(self.tabs.values())
+
+    def worksheet(self, title):
+        self.fake.request("worksheet")
+        if title not in self.tabs:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.tabs[title]
+
+    def add_worksheet(self, title, rows, cols):
+        self.fake.request("add_worksheet")
+        if title in self.tabs:
+            raise api_error(400, f"A sheet with the name \"{title}\" already exists.")
+        return self.load(title, [], row_count=rows, col_count=cols)
+
+    def values_batch_get(self, ranges, params=None):
+        self.fake.request("values_batch_get")
+        value_ranges = []
+        for range_name in ranges:
+            ws, a1 = self.tab(range_name)
+            values = ws.read(a1)
+            value_ranges.append({"range": range_name, **({"values": values} if values else {})})
+        return {"spreadsheetId": self.title, "valueRanges": value_ranges}
+
+    def values_batch_update(self, body=None):
+        self.fake.request("values_batch_update")
+        for item in body["data"]:
+            ws, a1 = self.tab(item["range"])
+            ws.write(a1 or "A1", item["values"])
+        return {"totalUpdatedRanges": len(body["data"])}
+
+    def batch_update(self, body):
+        self.fake.request("batch_update")
+        for request in body["requests"]:
+            dimension = request["appendDimension"]
+            ws = next(ws for ws in self.tabs.values() if ws.id == dimension["sheetId"])
+            if dimension["dimension"] == "ROWS":
+                ws.row_count += dimension["length"]
+            else:
+                ws.col_count += dimension["length"]
+        return {"replies": [{} for _ in body["requests"]]}
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, sheet_id, row_count, col_count):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.row_count = row_count
+        self.col_count = col_count
+        self.cells = []
+
+    def request(self, method):
+        self.spreadsheet.fake.request(method)
+
+    # Storage helpers; these do not count as requests
+
+    def read(self, a1=None):
+        """Values for a1 (the whole tab if None), trimmed of trailing empty cells and rows like the API."""
+        if a1 is None:
+            rows = [list(row) for row in self.cells]
+        else:
+            (top, left), (bottom, right) = self.bounds(a1)
+            rows = [[row[col] if col < len(row) else "" for col in range(left - 1, right)]
+                    for row in self.cells[top - 1:bottom]]
+        rows = [row[:max((i + 1 for i, value in enumerate(row) if value != ""), default=0)] for row in rows]
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def write(self, a1, values):
+        top, left = self.bounds(a1)[0]
+        bottom = top + len(values) - 1
+        right = left + max((len(row) for row in values), default=1) - 1
+        if bottom > self.row_count or right > self.col_count:
+            raise api_error(400, f"Range ('{self.title}'!{a1}) exceeds grid limits. Max rows: {self.row_count}, max columns: {self.col_count}")
+        for row_offset, row in enumerate(values):
+            while len(self.cells) < top + row_offset:
+                self.cells.append([])
+            target = self.cells[top + row_offset - 1]
+            for col_offset, value in enumerate(row):
+                col = left + col_offset
+                target.extend([""] * (col - len(target)))
+                target[col - 1] = "" if value is None else str(value)
+
+    def bounds(self, a1):
+        start, _, end = a1.partition(":")
+        if start.isdigit():  # whole rows, e.g. 1:1
+            return (int(start), 1), (int(end or start), self.col_count)
+        if start.isalpha():  # whole columns, e.g. D:D
+            start, end = f"{start}1", f"{end or start}{self.row_count}"
+        top_left = a1_to_rowcol(start)
+        return top_left, a1_to_rowcol(end) if end else top_left
+
+    # gspread Worksheet surface
+
+    def row_values(self, row):
+        self.request("row_values")
+        rows = self.read(f"{row}:{row}")
+        return rows[0] if rows else []
+
+    def col_values(self, col):
+        self.request("col_values")
+        letter = re.sub(r"\d", "", rowcol_to_a1(1, col))
+        return [row[0] if row else "" for row in self.read(f"{letter}:{letter}")]
+
+    def get_all_values(self):
+        self.request("get_all_values")
+        return self.read()
+
+    def update(self, range_name, values):
+        self.request("update")
+        self.write(range_name, values)
+
+    def update_cell(self, row, col, value):
+        self.request("update_cell")
+        self.write(rowcol_to_a1(row, col), [[value]])
+
+    def batch_update(self, data):
+        self.request("batch_update")
+        for item in data:
+            self.write(item["range"], item["values"])
+
+    def append_rows(self, values):
+        self.request("append_rows")
+        needed = len(self.read()) + len(values)
+        if needed > self.row_count:
+            self.row_count = needed
+        self.write(rowcol_to_a1(len(self.read()) + 1, 1), values)
+
+    def add_cols(self, cols):
+        self.request("add_cols")
+        self.col_count += cols
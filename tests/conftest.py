@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    """app.py imported with database.db and its relative paths in a scratch directory.
+
+    The scheduler is disabled, so no process takes the lease or flushes the Excel export.
+    """
+    workdir = tempfile.mkdtemp(prefix="attendance-tests-")
+    os.environ["SCHEDULER_ENABLED"] = "0"
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    import db
+    db.DATABASE_PATH = os.path.join(workdir, "database.db")
+    import app
+    return app
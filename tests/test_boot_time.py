@@ -0,0 +1,17 @@
+"""Importing app.py in a fresh interpreter must stay within BOOT_BUDGET_MS; see 'flask boot-report'."""
+import os
+import shutil
+
+from conftest import ROOT
+
+
+def test_boot_within_budget(app_module, tmp_path):
+    # Boot against a copy of the checked-in database so the import's migrations leave it untouched
+    shutil.copy(os.path.join(ROOT, "database.db"), tmp_path)
+    returncode, stderr, imports = app_module.measure_boot(cwd=tmp_path)
+    assert returncode == 0, stderr[-2000:]
+    total_ms = app_module.boot_ms(imports)
+    slowest = sorted((i for i in imports if i[2] == 1), reverse=True)[:5]
+    assert total_ms <= app_module.BOOT_BUDGET_MS, (
+        f"import app took {total_ms:.0f} ms (budget {app_module.BOOT_BUDGET_MS} ms); slowest imports: "
+        + ", ".join(f"{module} {cumulative / 1000:.0f} ms" for cumulative, _, _, module in slowest))
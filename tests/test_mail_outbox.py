@@ -0,0 +1,56 @@
+"""Queued email is delivered through a local aiosmtpd server and removed from mail_outbox."""
+import socket
+import time
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+
+class Inbox:
+    def __init__(self):
+        self.envelopes = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.envelopes.append(envelope)
+        return "250 Message accepted for delivery"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(app_module, monkeypatch):
+    inbox = Inbox()
+    controller = aiosmtpd_controller.Controller(inbox, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    monkeypatch.setattr(app_module, "SMTP_SERVER", controller.hostname)
+    monkeypatch.setattr(app_module, "SMTP_PORT", controller.port)
+    monkeypatch.setattr(app_module, "SMTP_STARTTLS", False)
+    yield inbox
+    controller.stop()
+
+
+def test_queued_email_is_delivered_and_removed(app_module, smtp_server):
+    conn = app_module.get_db()
+    c = conn.cursor()
+    app_module.queue_email(c, "student@example.com", "Absence alert", "You were marked absent today.")
+    row_id = c.lastrowid
+    conn.commit()
+
+    app_module.send_queued_email()
+    # The mail-outbox thread may have claimed the message first; either way it is sent on the pool
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if c.execute("SELECT COUNT(*) FROM mail_outbox WHERE id = ?", (row_id,)).fetchone()[0] == 0:
+            break
+        time.sleep(0.05)
+
+    assert c.execute("SELECT COUNT(*) FROM mail_outbox WHERE id = ?", (row_id,)).fetchone()[0] == 0
+    assert [envelope.rcpt_tos for envelope in smtp_server.envelopes] == [["student@example.com"]]
+    message = smtp_server.envelopes[0].content.decode()
+    assert "Subject: Absence alert" in message
+    assert "You were marked absent today." in message
@@ -0,0 +1,43 @@
+"""The dashboard's hot queries must stay on their indexes; see hot_query_checks() in app.py."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+def hot_queries():
+    # Listed here so each query is its own test without importing app.py at collection time;
+    # test_every_hot_query_is_covered keeps the list in step with hot_query_checks()
+    return ["student count (branch=CSE, course=GENAI)", "attendance list (branch=CSE, course=GENAI)",
+            "student count (branch=None, course=GENAI)", "attendance list (branch=None, course=GENAI)",
+            "student count (branch=CSE, course=None)", "attendance list (branch=CSE, course=None)",
+            "feedback list", "resume list", "resume search", "dashboard present count"]
+
+
+@pytest.mark.parametrize("name", hot_queries())
+def test_hot_query_uses_index(app_module, name):
+    checks = {check[0]: check[1:] for check in app_module.hot_query_checks()}
+    sql, params, index = checks[name]
+    plan = app_module.explain_query_plan(sql, params)
+    assert app_module.uses_index(plan, index), f"{name}: expected USING [COVERING] INDEX {index}, got plan: {plan}"
+
+
+def test_every_hot_query_is_covered(app_module):
+    assert sorted(check[0] for check in app_module.hot_query_checks()) == sorted(hot_queries())
+
+
+def test_check_query_plans_reports_no_regressions(app_module):
+    assert app_module.check_query_plans() == []
+
+
+def test_dropped_index_is_reported(app_module):
+    conn = app_module.get_db()
+    conn.execute("DROP INDEX idx_feedback_date")
+    try:
+        # Checked from another thread, which gets its own connection: this one's statement cache
+        # still holds the EXPLAIN compiled against the old schema
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            failures = executor.submit(app_module.check_query_plans).result()
+        assert any(failure.startswith("feedback list") for failure in failures)
+    finally:
+        app_module.create_indexes(conn.cursor())
+        conn.commit()